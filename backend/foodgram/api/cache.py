@@ -0,0 +1,80 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.models import Favorite, ShoppingCart
+from users.models import Follow
+
+
+def get_cache_key(namespace, data_version):
+    return f'api:{namespace}:{data_version}'
+
+
+def get_user_flags(user):
+    """Избранное, корзина и подписки пользователя для ответов из кэша."""
+    key = f'api:user-flags:{user.id}'
+    flags = cache.get(key)
+    if flags is None:
+        flags = {
+            'favorites': set(Favorite.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+            'shopping_cart': set(ShoppingCart.objects.filter(
+                user=user
+            ).values_list('recipe_id', flat=True)),
+            'following': set(Follow.objects.filter(
+                user=user
+            ).values_list('following_id', flat=True)),
+        }
+        cache.set(key, flags, settings.API_USER_FLAGS_TIMEOUT)
+    return flags
+
+
+def invalidate_user_flags(user_id):
+    cache.delete(f'api:user-flags:{user_id}')
+
+
+class CachedResponseMixin:
+    """
+    Кэширует общий для всех пользователей ответ list/retrieve.
+    Персональные поля подставляются после чтения из кэша. Ключ -
+    data_version из ConditionalGetMixin: он меняется вместе с версиями
+    данных в базе, так что ответ и его ETag не расходятся ни в одном
+    воркере.
+    """
+    cache_namespace = None
+    data_version = None
+    shared_response = False
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def is_cacheable(self, request):
+        return True
+
+    def personalize(self, data, user):
+        return data
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        if self.data_version is None or not self.is_cacheable(request):
+            return handler(request, *args, **kwargs)
+        key = get_cache_key(self.cache_namespace, self.data_version)
+        data = cache.get(key)
+        if data is None:
+            self.shared_response = True
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            data = response.data
+            cache.set(key, data, settings.API_CACHE_TIMEOUT)
+        if request.user.is_authenticated:
+            data = self.personalize(data, request.user)
+        return Response(data)
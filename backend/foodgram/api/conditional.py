@@ -0,0 +1,87 @@
+import hashlib
+from calendar import timegm
+from urllib.parse import urlencode
+
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+
+from recipes.models import DataVersion
+
+
+class ConditionalGetMixin:
+    """
+    ETag и Last-Modified для list/retrieve по версиям данных.
+    На совпавший If-None-Match отвечает 304 без сериализации.
+    Общая для всех пользователей часть валидаторов - data_version,
+    по ней же CachedResponseMixin строит ключ кэша. Ответы, которые
+    версии данных не описывают (is_conditional), не кэшируются.
+    """
+    version_names = ()
+    personal = False
+    data_version = None
+
+    def list(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def is_conditional(self, request):
+        return True
+
+    def get_version_names(self, request):
+        return list(self.version_names)
+
+    def get_validators(self, request):
+        """Общие части ETag, личные части ETag и даты изменения."""
+        parts = [request.path, urlencode(
+            sorted(request.query_params.lists()), doseq=True
+        )]
+        names = self.get_version_names(request)
+        personal_parts = []
+        if self.personal and request.user.is_authenticated:
+            personal_parts.append(f'user:{request.user.id}')
+            names.append(f'user:{request.user.id}')
+        modified = []
+        versions = DataVersion.objects.filter(
+            name__in=names
+        ).order_by('name')
+        for version in versions:
+            if version.name.startswith('user:'):
+                personal_parts.append(f'version:{version.version}')
+            else:
+                parts.append(f'{version.name}:{version.version}')
+            modified.append(version.updated_at)
+        return parts, personal_parts, modified
+
+    def get_conditional_response(self, handler, request, *args, **kwargs):
+        if not self.is_conditional(request):
+            return self.patch_vary(handler(request, *args, **kwargs))
+        parts, personal_parts, modified = self.get_validators(request)
+        self.data_version = hashlib.md5('|'.join(parts).encode()).hexdigest()
+        etag = '"{}"'.format(hashlib.md5(
+            '|'.join([self.data_version, *personal_parts]).encode()
+        ).hexdigest())
+        last_modified = None
+        if modified:
+            last_modified = timegm(max(modified).utctimetuple())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                response['ETag'] = etag
+                if last_modified is not None:
+                    response['Last-Modified'] = http_date(last_modified)
+        return self.patch_vary(response)
+
+    def patch_vary(self, response):
+        if self.personal:
+            patch_vary_headers(response, ['Authorization'])
+        return response
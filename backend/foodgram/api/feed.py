@@ -0,0 +1,131 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from recipes.models import DataVersion, Recipe
+from users.models import Follow, User
+from .cache import get_user_flags
+
+
+def get_timeline_key(user_id):
+    return f'api:feed:{user_id}'
+
+
+def get_author_version_name(author_id):
+    return f'author:{author_id}'
+
+
+def get_author_versions(authors):
+    """
+    Версии рецептов авторов из базы: меняются при создании, изменении
+    и удалении рецепта в любом процессе.
+    """
+    return dict(DataVersion.objects.filter(name__in=[
+        get_author_version_name(author_id) for author_id in authors
+    ]).values_list('name', 'version'))
+
+
+def query_feed(authors, position, limit):
+    """Записи ленты (pub_date, id, автор) из базы, новые сверху."""
+    recipes = Recipe.objects.filter(author__in=authors)
+    if position is not None:
+        pub_date, recipe_id = position
+        recipes = recipes.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=recipe_id)
+        )
+    return list(recipes.order_by('-pub_date', '-id').values_list(
+        'pub_date', 'id', 'author_id'
+    )[:limit])
+
+
+def get_timeline(user_id, authors):
+    """
+    Лента из кэша. Если набор авторов изменился (подписка, отписка,
+    автор стал популярным) или версия рецептов какого-то автора в базе
+    не совпадает с записанной в ленте (рецепт создан или удалён в другом
+    процессе), лента собирается заново из базы.
+    """
+    key = get_timeline_key(user_id)
+    timeline = cache.get(key)
+    versions = get_author_versions(authors)
+    if (
+        timeline is None
+        or timeline['authors'] != authors
+        or timeline['versions'] != versions
+    ):
+        entries = query_feed(authors, None, settings.FEED_TIMELINE_SIZE)
+        timeline = {
+            'authors': authors,
+            'versions': versions,
+            'entries': entries,
+            'truncated': len(entries) == settings.FEED_TIMELINE_SIZE,
+        }
+        cache.set(key, timeline, settings.FEED_TIMELINE_TTL)
+    return timeline
+
+
+def get_feed(user, position, limit):
+    """
+    Не больше limit записей ленты после position. Рецепты обычных авторов
+    берутся из ленты в кэше, авторов с числом подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS - запросом при чтении.
+    """
+    following = get_user_flags(user)['following']
+    if not following:
+        return []
+    popular = set(User.objects.filter(
+        id__in=following,
+        followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('id', flat=True))
+    timeline = get_timeline(user.id, following - popular)
+    entries = [
+        entry for entry in timeline['entries']
+        if position is None or entry[:2] < tuple(position)
+    ]
+    if timeline['truncated'] and len(entries) < limit:
+        return query_feed(following, position, limit)
+    if popular:
+        entries = sorted(
+            set(entries) | set(query_feed(popular, position, limit)),
+            reverse=True
+        )
+    return entries[:limit]
+
+
+def fan_out_recipe(recipe_id):
+    """
+    Добавляет новый рецепт в уже собранные ленты подписчиков автора.
+    Лента, в которой записана не предыдущая версия рецептов автора,
+    пропустила чужое изменение: она удаляется и соберётся заново.
+    """
+    recipe = Recipe.objects.filter(id=recipe_id).values_list(
+        'pub_date', 'id', 'author_id', 'author__followers_count'
+    ).first()
+    if recipe is None or recipe[3] > settings.FEED_FANOUT_MAX_FOLLOWERS:
+        return
+    entry, author_id = recipe[:3], recipe[2]
+    name = get_author_version_name(author_id)
+    version = get_author_versions([author_id]).get(name)
+    keys = [
+        get_timeline_key(user_id)
+        for user_id in Follow.objects.filter(
+            following_id=author_id
+        ).values_list('user_id', flat=True)
+    ]
+    timelines, stale = {}, []
+    for key, timeline in cache.get_many(keys).items():
+        if author_id not in timeline['authors']:
+            continue
+        if timeline['versions'].get(name, -1) + 1 == version:
+            timelines[key] = timeline
+        elif timeline['versions'].get(name) != version:
+            stale.append(key)
+    for timeline in timelines.values():
+        timeline['versions'][name] = version
+        entries = sorted([entry, *timeline['entries']], reverse=True)
+        if len(entries) > settings.FEED_TIMELINE_SIZE:
+            entries = entries[:settings.FEED_TIMELINE_SIZE]
+            timeline['truncated'] = True
+        timeline['entries'] = entries
+    cache.set_many(timelines, settings.FEED_TIMELINE_TTL)
+    cache.delete_many(stale)
@@ -1,9 +1,80 @@
-from django.db.models import BooleanField, ExpressionWrapper, Q
-from django_filters.rest_framework import (Filter, FilterSet,
-                                           ModelMultipleChoiceFilter,
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+from django_filters.fields import MultipleChoiceField
+from django_filters.rest_framework import (CharFilter, ChoiceFilter, Filter,
+                                           FilterSet, MultipleChoiceFilter,
                                            NumberFilter)
 
 from recipes.models import Recipe, Tag
+from .ingredient_search import search_ingredients
+from .pagination import RECIPE_ORDERINGS
+from .recipe_search import search_recipes
+
+
+class TagSlugs:
+    """Соответствие slug -> id тэгов в памяти процесса."""
+
+    def __init__(self):
+        self._ids = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+    def ensure(self, slugs):
+        """
+        Тэг мог появиться в другом процессе или при загрузке из файла:
+        если каких-то slug нет, соответствие один раз перечитывается.
+        """
+        if not set(slugs) <= self.ids().keys():
+            self.invalidate()
+
+    def ids(self):
+        expired = (
+            time.monotonic() - self._loaded_at > settings.TAG_SLUGS_CACHE_TTL
+        )
+        if self._ids is None or expired:
+            with self._lock:
+                if self._ids is not None and not expired:
+                    return self._ids
+                self._ids = dict(Tag.objects.values_list('slug', 'id'))
+                self._loaded_at = time.monotonic()
+        return self._ids
+
+
+tag_slugs = TagSlugs()
+
+
+class TagSlugsField(MultipleChoiceField):
+    """Перед отказом в неизвестном slug перечитывает тэги из базы."""
+
+    def validate(self, value):
+        tag_slugs.ensure(value)
+        super().validate(value)
+
+
+class TagSlugsFilter(MultipleChoiceFilter):
+    field_class = TagSlugsField
+
+
+def get_tag_choices():
+    return [(slug, slug) for slug in tag_slugs.ids()]
+
+
+TAGS_MODES = (
+    ('any', 'Любой из тэгов'),
+    ('all', 'Все тэги'),
+)
+ORDERINGS = (
+    ('new', 'Сначала новые'),
+    ('popular', 'Больше всего в избранном'),
+    ('trending', 'Популярные сейчас'),
+)
 
 
 class RecipeFilter(FilterSet):
@@ -16,10 +87,20 @@ class RecipeFilter(FilterSet):
     author = Filter(
         method='filter_author'
     )
-    tags = ModelMultipleChoiceFilter(
-        queryset=Tag.objects.all(),
-        field_name='tags__slug',
-        to_field_name='slug'
+    tags = TagSlugsFilter(
+        choices=get_tag_choices,
+        method='filter_tags'
+    )
+    tags_mode = ChoiceFilter(
+        choices=TAGS_MODES,
+        method='filter_tags_mode'
+    )
+    search = CharFilter(
+        method='filter_search'
+    )
+    ordering = ChoiceFilter(
+        choices=ORDERINGS,
+        method='filter_ordering'
     )
 
     def filter_is_favorited(self, queryset, name, value):
@@ -37,13 +118,35 @@ class RecipeFilter(FilterSet):
             return queryset.filter(author=self.request.user)
         return queryset.filter(author=value)
 
+    def filter_tags(self, queryset, name, value):
+        """Подзапрос по связям рецепт-тэг вместо JOIN: без дублей."""
+        tag_ids = {tag_slugs.ids()[slug] for slug in value}
+        recipes = Recipe.tags.through.objects.filter(tag_id__in=tag_ids)
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            recipes = recipes.values('recipe_id').annotate(
+                tags_count=Count('tag_id')
+            ).filter(tags_count=len(tag_ids))
+        return queryset.filter(id__in=recipes.values('recipe_id'))
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ordering(self, queryset, name, value):
+        return queryset.order_by(*RECIPE_ORDERINGS[value])
+
     class Meta:
         model = Recipe
         fields = (
             'is_favorited',
             'is_in_shopping_cart',
             'author',
-            'tags'
+            'tags',
+            'tags_mode',
+            'search',
+            'ordering'
         )
 
 
@@ -53,9 +156,6 @@ class IngredientFilter(FilterSet):
     )
 
     def filter_name(self, queryset, name, value):
-        data = queryset.filter(name__contains=value)
-        startswith = ExpressionWrapper(
-            Q(name__startswith=value),
-            output_field=BooleanField()
-        )
-        return data.annotate(startswith=startswith).order_by('-startswith')
+        return search_ingredients(
+            queryset, value
+        )[:settings.INGREDIENT_SEARCH_LIMIT]
@@ -0,0 +1,105 @@
+import base64
+import binascii
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+from rest_framework.serializers import ValidationError
+
+from recipes.models import Recipe
+
+HEADER_CHUNK = 65536
+THUMBNAILS_DIR = 'recipes/images/thumbs'
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.IMAGE_THUMBNAIL_WORKERS,
+    thread_name_prefix='thumbnails'
+)
+
+
+def validate_base64_image(imgstr):
+    """Проверяет размер и разрешение до полного декодирования."""
+    size = len(imgstr) * 3 // 4 - imgstr[-2:].count('=')
+    if size > settings.IMAGE_MAX_SIZE:
+        raise ValidationError(
+            'Размер изображения не должен превышать '
+            f'{settings.IMAGE_MAX_SIZE // (1024 * 1024)} МБ!'
+        )
+    chunk = imgstr[:HEADER_CHUNK - HEADER_CHUNK % 4]
+    try:
+        width, height = Image.open(BytesIO(base64.b64decode(chunk))).size
+    except (OSError, ValueError, binascii.Error):
+        return
+    if width * height > settings.IMAGE_MAX_PIXELS:
+        raise ValidationError('Слишком большое разрешение изображения!')
+
+
+def get_variant_name(name, width):
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return f'{THUMBNAILS_DIR}/{stem}_{width}.webp'
+
+
+def get_image_variants(recipe, request=None):
+    if not recipe.image:
+        return {}
+    variants = {}
+    for width in settings.IMAGE_THUMBNAIL_WIDTHS:
+        if recipe.thumbnails_ready:
+            url = default_storage.url(
+                get_variant_name(recipe.image.name, width)
+            )
+        else:
+            url = recipe.image.url
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        variants[str(width)] = url
+    return variants
+
+
+def generate_thumbnails(recipe_id, name):
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    for width in settings.IMAGE_THUMBNAIL_WIDTHS:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((width, image.height))
+        buffer = BytesIO()
+        thumbnail.save(buffer, 'WEBP', quality=80)
+        variant_name = get_variant_name(name, width)
+        if default_storage.exists(variant_name):
+            default_storage.delete(variant_name)
+        default_storage.save(variant_name, ContentFile(buffer.getvalue()))
+    recipe = Recipe.objects.filter(pk=recipe_id, image=name).first()
+    if recipe is not None:
+        recipe.thumbnails_ready = True
+        recipe.save(update_fields=['thumbnails_ready', 'updated_at'])
+
+
+def generate_thumbnails_in_background(recipe_id, name):
+    try:
+        generate_thumbnails(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+    finally:
+        connection.close()
+
+
+def schedule_thumbnails(recipe):
+    """Запускает генерацию превью после фиксации транзакции."""
+    args = (recipe.pk, recipe.image.name)
+    if settings.IMAGE_THUMBNAILS_ASYNC:
+        transaction.on_commit(lambda: executor.submit(
+            generate_thumbnails_in_background, *args
+        ))
+    else:
+        transaction.on_commit(lambda: generate_thumbnails(*args))
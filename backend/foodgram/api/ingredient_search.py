@@ -0,0 +1,108 @@
+import difflib
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import BooleanField, ExpressionWrapper, Q
+
+from recipes.models import Ingredient
+
+FUZZY_MIN_LENGTH = 3
+FUZZY_THRESHOLD = 0.75
+
+
+def normalize(value):
+    return ' '.join(value.lower().replace('ё', 'е').split())
+
+
+def search_ingredients(queryset, value):
+    """Поиск ингредиентов в БД: сначала совпадения по началу названия."""
+    startswith = ExpressionWrapper(
+        Q(name__istartswith=value),
+        output_field=BooleanField()
+    )
+    if connections[queryset.db].vendor == 'postgresql':
+        return queryset.filter(
+            Q(name__icontains=value) | Q(name__trigram_similar=value)
+        ).annotate(
+            startswith=startswith,
+            similarity=TrigramSimilarity('name', value)
+        ).order_by('-startswith', '-similarity', 'name')
+    return queryset.filter(
+        name__icontains=value
+    ).annotate(
+        startswith=startswith
+    ).order_by('-startswith', 'name')
+
+
+class IngredientIndex:
+    """Справочник ингредиентов в памяти процесса для автодополнения."""
+
+    def __init__(self):
+        self._rows = None
+        self._loaded_at = 0
+        self._lock = threading.Lock()
+        self._search = lru_cache(
+            maxsize=settings.INGREDIENT_SEARCH_CACHE_SIZE
+        )(self._rank)
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            self._search.cache_clear()
+
+    def rows(self):
+        expired = (
+            time.monotonic() - self._loaded_at
+            > settings.INGREDIENT_SEARCH_CACHE_TTL
+        )
+        if self._rows is None or expired:
+            with self._lock:
+                if self._rows is not None and not expired:
+                    return self._rows
+                rows = list(Ingredient.objects.values(
+                    'id', 'name', 'measurement_unit'
+                )[:settings.INGREDIENT_SEARCH_CACHE_MAX_ROWS + 1])
+                if len(rows) > settings.INGREDIENT_SEARCH_CACHE_MAX_ROWS:
+                    rows = []
+                self._rows = [(normalize(row['name']), row) for row in rows]
+                self._loaded_at = time.monotonic()
+                self._search.cache_clear()
+        return self._rows
+
+    def search(self, value):
+        """Вернёт None, если справочник слишком велик для памяти."""
+        rows = self.rows()
+        if not rows:
+            return None
+        return self._search(normalize(value))
+
+    def _rank(self, query):
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        rows = self.rows()
+        ranked = []
+        for name, row in rows:
+            if name.startswith(query):
+                ranked.append((0, 0, name, row))
+            elif any(word.startswith(query) for word in name.split()):
+                ranked.append((1, 0, name, row))
+            elif query in name:
+                ranked.append((2, 0, name, row))
+        if len(ranked) < limit and len(query) >= FUZZY_MIN_LENGTH:
+            found = {row['id'] for *_, row in ranked}
+            for name, row in rows:
+                if row['id'] in found:
+                    continue
+                ratio = difflib.SequenceMatcher(
+                    None, query, name[:len(query)]
+                ).ratio()
+                if ratio >= FUZZY_THRESHOLD:
+                    ranked.append((3, -ratio, name, row))
+        ranked.sort(key=lambda item: item[:3])
+        return [row for *_, row in ranked[:limit]]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,137 @@
+import math
+import random
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Favorite, Recipe, Tag
+from users.models import Follow, User
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    rank = math.ceil(percent / 100 * len(values))
+    return values[max(rank, 1) - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Прогоняет основные сценарии API и выводит p50/p95/p99 времени '
+        'ответа и число SQL-запросов на запрос'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument('--user', help='Имя пользователя для сценариев')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Отключить кэш ответов API')
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument(
+            '--conn-max-age', type=int, default=None,
+            help='CONN_MAX_AGE на время прогона, 0 - соединение на запрос'
+        )
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        if options['conn_max_age'] is not None:
+            for db in connections.all():
+                db.close()
+                db.settings_dict['CONN_MAX_AGE'] = options['conn_max_age']
+        user = self.get_user(options['user'])
+        recipes = list(Recipe.objects.values_list('id', flat=True)[:1000])
+        if not recipes:
+            raise CommandError(
+                'Нет рецептов: python manage.py generate_load_data'
+            )
+        favorites = set(Favorite.objects.filter(
+            user=user
+        ).values_list('recipe_id', flat=True))
+        toggle = [recipe for recipe in recipes if recipe not in favorites]
+        tag = Tag.objects.values_list('slug', flat=True).first()
+        token, _ = Token.objects.get_or_create(user=user)
+        client = Client(HTTP_AUTHORIZATION=f'Token {token.key}')
+        scenarios = [
+            ('recipes list', lambda: ('get', '/api/recipes/?limit=6')),
+            ('recipes by tag',
+             lambda: ('get', f'/api/recipes/?tags={tag}&limit=6')),
+            ('recipes favorited',
+             lambda: ('get', '/api/recipes/?is_favorited=1&limit=6')),
+            ('recipe detail', lambda: (
+                'get', f'/api/recipes/{random.choice(recipes)}/'
+            )),
+            ('favorite add', lambda: (
+                'post', f'/api/recipes/{toggle[0]}/favorite/'
+            )),
+            ('favorite remove', lambda: (
+                'delete', f'/api/recipes/{toggle[0]}/favorite/'
+            )),
+            ('cart download',
+             lambda: ('get', '/api/recipes/download_shopping_cart/')),
+            ('subscriptions', lambda: (
+                'get', '/api/users/subscriptions/?limit=6&recipes_limit=3'
+            )),
+        ]
+        if not toggle:
+            scenarios = [
+                scenario for scenario in scenarios
+                if not scenario[0].startswith('favorite')
+            ]
+        results = {name: ([], []) for name, _ in scenarios}
+        overrides = {}
+        if options['no_cache']:
+            overrides['API_CACHE_TIMEOUT'] = 0
+            cache.clear()
+        with override_settings(**overrides):
+            for _ in range(options['repeat']):
+                for name, scenario in scenarios:
+                    timings, queries = results[name]
+                    method, url = scenario()
+                    elapsed, count = self.request(client, method, url)
+                    timings.append(elapsed)
+                    queries.append(count)
+        self.stdout.write(
+            f'{"scenario":>18} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} '
+            f'{"queries":>8}'
+        )
+        for name, (timings, queries) in results.items():
+            self.stdout.write(
+                f'{name:>18} {percentile(timings, 50):8.2f} '
+                f'{percentile(timings, 95):8.2f} '
+                f'{percentile(timings, 99):8.2f} {max(queries):8d}'
+            )
+
+    def get_user(self, username):
+        if username:
+            user = User.objects.filter(username=username).first()
+        else:
+            user = User.objects.filter(
+                id__in=Follow.objects.values('user')
+            ).order_by('id').first()
+        if user is None:
+            raise CommandError('Пользователь для сценариев не найден.')
+        return user
+
+    def request(self, client, method, url):
+        """
+        Тестовый клиент не закрывает соединения после ответа, поэтому
+        это делается здесь, как в обработчике запросов, по CONN_MAX_AGE
+        (кроме прогона внутри транзакции). Время подключения к базе
+        попадает в замер.
+        """
+        start = time.perf_counter()
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(client, method)(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        elapsed = (time.perf_counter() - start) * 1000
+        if not connection.in_atomic_block:
+            close_old_connections()
+        if response.status_code >= 400:
+            raise CommandError(f'{method.upper()} {url} вернул '
+                               f'{response.status_code}')
+        return elapsed, len(queries)
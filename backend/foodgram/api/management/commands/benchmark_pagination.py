@@ -0,0 +1,56 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+
+from api.pagination import RecipePagination
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает время ответа первой и глубокой страницы списка '
+        'рецептов для пагинации по номеру страницы и по курсору'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page', type=int, default=5000)
+        parser.add_argument('--limit', type=int, default=6)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        page, limit = options['page'], options['limit']
+        offset = (page - 1) * limit
+        total = Recipe.objects.count()
+        if offset >= total:
+            self.stderr.write(
+                f'Нужно больше {offset} рецептов, в базе {total}.'
+            )
+            return
+        paginator = RecipePagination()
+        last = Recipe.objects.order_by(*paginator.ordering)[offset - 1]
+        cursor = paginator.encode_cursor([last.pub_date, last.id])
+        urls = [
+            ('page 1', f'/api/recipes/?page=1&limit={limit}'),
+            (f'page {page}', f'/api/recipes/?page={page}&limit={limit}'),
+            ('cursor 1', f'/api/recipes/?cursor=&limit={limit}'),
+            (f'cursor {page}',
+             f'/api/recipes/?cursor={cursor}&limit={limit}'),
+        ]
+        client = Client()
+        with override_settings(API_CACHE_TIMEOUT=0):
+            for name, url in urls:
+                timings = []
+                for _ in range(options['repeat']):
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    timings.append((time.perf_counter() - start) * 1000)
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'{url} вернул {response.status_code}'
+                        )
+                self.stdout.write(
+                    f'{name:>14}: median {statistics.median(timings):8.2f} ms'
+                    f', max {max(timings):8.2f} ms'
+                )
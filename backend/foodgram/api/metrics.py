@@ -0,0 +1,208 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+logger = logging.getLogger(__name__)
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+
+class QueryBudgetExceededError(Exception):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.total_time = 0.0
+        self.query_budget = None
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+    def server_timing(self):
+        return ', '.join((
+            f'sql;dur={self.sql_time * 1000:.1f};'
+            f'desc="{self.queries} queries"',
+            f'serializer;dur={self.serializer_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ))
+
+
+class MetricsRegistry:
+    """Накопленные метрики запросов в формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)
+
+    def observe(self, endpoint, method, status, metrics):
+        labels = f'endpoint="{endpoint}",method="{method}"'
+        with self._lock:
+            self._values[
+                ('foodgram_requests_total', f'{labels},status="{status}"')
+            ] += 1
+            self._values[('foodgram_request_seconds_sum', labels)] += (
+                metrics.total_time
+            )
+            self._values[('foodgram_sql_queries_total', labels)] += (
+                metrics.queries
+            )
+            self._values[('foodgram_sql_seconds_sum', labels)] += (
+                metrics.sql_time
+            )
+            self._values[('foodgram_serializer_seconds_sum', labels)] += (
+                metrics.serializer_time
+            )
+            if is_over_budget(metrics):
+                self._values[
+                    ('foodgram_query_budget_exceeded_total', labels)
+                ] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return ''.join(
+            f'{name}{{{labels}}} {value:g}\n'
+            for (name, labels), value in items
+        )
+
+
+registry = MetricsRegistry()
+
+
+def is_over_budget(metrics):
+    return (
+        metrics.query_budget is not None
+        and metrics.queries > metrics.query_budget
+    )
+
+
+class MetricsMiddleware:
+    """
+    SQL, сериализация и общее время запроса в заголовке Server-Timing.
+    У потокового ответа заголовок описывает только работу view: запросы
+    при отдаче тела учитываются в метриках и бюджете после отдачи.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        start = time.perf_counter()
+        with self.measure(metrics):
+            response = self.get_response(request)
+        metrics.total_time = time.perf_counter() - start
+        response['Server-Timing'] = metrics.server_timing()
+        if response.streaming:
+            response.streaming_content = self.measure_stream(
+                response.streaming_content, request, response, metrics, start
+            )
+        else:
+            self.observe(request, response, metrics)
+        return response
+
+    @contextmanager
+    def measure(self, metrics):
+        token = current_metrics.set(metrics)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.sql_wrapper)
+                    )
+                yield
+        finally:
+            current_metrics.reset(token)
+
+    def measure_stream(self, content, request, response, metrics, start):
+        with self.measure(metrics):
+            yield from content
+        metrics.total_time = time.perf_counter() - start
+        self.observe(request, response, metrics)
+
+    def observe(self, request, response, metrics):
+        endpoint = 'unknown'
+        if request.resolver_match is not None:
+            endpoint = request.resolver_match.view_name
+        registry.observe(
+            endpoint, request.method, response.status_code, metrics
+        )
+        if is_over_budget(metrics):
+            message = (
+                f'{request.method} {request.path}: {metrics.queries} '
+                f'SQL-запросов при бюджете {metrics.query_budget}'
+            )
+            if settings.QUERY_BUDGET_STRICT:
+                raise QueryBudgetExceededError(message)
+            logger.warning(message)
+
+
+@lru_cache(maxsize=None)
+def timed_serializer(serializer_class):
+    class TimedSerializer(serializer_class):
+        def to_representation(self, instance):
+            metrics = current_metrics.get()
+            if metrics is None:
+                return super().to_representation(instance)
+            start = time.perf_counter()
+            try:
+                return super().to_representation(instance)
+            finally:
+                metrics.serializer_time += time.perf_counter() - start
+
+    TimedSerializer.__name__ = serializer_class.__name__
+    TimedSerializer.__qualname__ = serializer_class.__qualname__
+    return TimedSerializer
+
+
+class InstrumentedViewMixin:
+    """
+    Замеряет время сериализации и задаёт бюджет SQL-запросов:
+    число или словарь {action: число}.
+    """
+    query_budget = None
+
+    def get_query_budget(self):
+        if isinstance(self.query_budget, dict):
+            return self.query_budget.get(self.action)
+        return self.query_budget
+
+    def initial(self, request, *args, **kwargs):
+        metrics = current_metrics.get()
+        if metrics is not None:
+            metrics.query_budget = self.get_query_budget()
+        super().initial(request, *args, **kwargs)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer_class = timed_serializer(self.get_serializer_class())
+        kwargs['context'] = self.get_serializer_context()
+        return serializer_class(*args, **kwargs)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Метрики для Prometheus, только для администраторов."""
+    return HttpResponse(
+        registry.render(),
+        content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,172 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from operator import attrgetter
+
+from django.core.exceptions import ValidationError
+from django.db.models import F, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class PageNumberKeysetPagination(PageNumberPagination):
+    """
+    Постраничная навигация по номеру страницы, а при параметре cursor -
+    keyset-пагинация по полям ordering без COUNT и OFFSET. Записи с NULL
+    в поле сортировки идут в конце при любом направлении.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор.'
+    ordering = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.use_cursor = (
+            self.ordering is not None
+            and self.cursor_query_param in request.query_params
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        self.request = request
+        self.model = queryset.model
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by(*self.get_order_by())
+        cursor = request.query_params[self.cursor_query_param]
+        if cursor:
+            queryset = queryset.filter(
+                self.get_keyset_filter(self.decode_cursor(cursor))
+            )
+        page = list(queryset[:page_size + 1])
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if not self.has_next:
+            return None
+        position = self.get_position(self.page[-1])
+        url = remove_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param
+        )
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position)
+        )
+
+    def get_position(self, item):
+        return [
+            attrgetter(field.lstrip('-').replace('__', '.'))(item)
+            for field in self.ordering
+        ]
+
+    def get_order_by(self):
+        order_by = []
+        for field in self.ordering:
+            name = field.lstrip('-')
+            if not self.get_field(name).null:
+                order_by.append(field)
+            elif field.startswith('-'):
+                order_by.append(F(name).desc(nulls_last=True))
+            else:
+                order_by.append(F(name).asc(nulls_last=True))
+        return order_by
+
+    def get_keyset_filter(self, position):
+        keyset_filter = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            if value is None:
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after = Q(**{f'{name}__{lookup}': value})
+            if self.get_field(name).null:
+                after |= Q(**{f'{name}__isnull': True})
+            keyset_filter |= equal & after
+            equal &= Q(**{name: value})
+        return keyset_filter
+
+    def get_field(self, name):
+        model = self.model
+        *relations, name = name.split('__')
+        for relation in relations:
+            model = model._meta.get_field(relation).related_model
+        return model._meta.get_field(name)
+
+    def encode_cursor(self, position):
+        data = json.dumps(position, default=str).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            if len(position) != len(self.ordering):
+                raise ValueError
+            return [
+                self.get_field(field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+
+RECIPE_ORDERINGS = {
+    'new': ('-pub_date', '-id'),
+    'popular': ('-favorites_count', '-id'),
+    'trending': ('-trending_score', '-id'),
+}
+
+
+class RecipePagination(PageNumberKeysetPagination):
+    ordering = RECIPE_ORDERINGS['new']
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = RECIPE_ORDERINGS.get(
+            request.query_params.get('ordering'), self.ordering
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+
+class FeedPagination(RecipePagination):
+    """
+    Только keyset: вместо queryset передаётся функция (позиция, лимит),
+    которая возвращает записи ленты (pub_date, id, автор).
+    """
+
+    def paginate_queryset(self, feed, request, view=None):
+        self.use_cursor = True
+        self.request = request
+        self.model = view.queryset.model
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        position = self.decode_cursor(cursor) if cursor else None
+        page = feed(position, page_size + 1)
+        self.has_next = len(page) > page_size
+        self.page = page[:page_size]
+        return self.page
+
+    def get_position(self, item):
+        return list(item[:len(self.ordering)])
+
+
+class UserPagination(PageNumberKeysetPagination):
+    ordering = ('username', 'id')
+
+
+class SubscriptionPagination(PageNumberKeysetPagination):
+    ordering = ('following__username', 'id')
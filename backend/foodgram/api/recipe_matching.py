@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Max, Q
+
+from recipes.models import DataVersion, Recipe, RecipeIngredient
+
+SYNC_MARGIN = timedelta(seconds=30)
+
+logger = logging.getLogger(__name__)
+
+
+def get_recipes_version():
+    return DataVersion.objects.filter(
+        name='recipes'
+    ).values_list('version', flat=True).first()
+
+
+def match_recipes(ingredient_ids, max_missing):
+    """
+    Подбор запросом к базе, пока индекс в памяти не построен: у рецептов
+    хотя бы с одним из ингредиентов считаются все и совпавшие ингредиенты.
+    """
+    return Recipe.objects.filter(
+        id__in=RecipeIngredient.objects.filter(
+            ingredient__in=ingredient_ids
+        ).values('recipe_id')
+    ).values('id').annotate(
+        size=Count('recipe_ingredient'),
+        matched=Count('recipe_ingredient', filter=Q(
+            recipe_ingredient__ingredient__in=ingredient_ids
+        ))
+    ).annotate(
+        missing=F('size') - F('matched')
+    ).filter(
+        size__lte=len(set(ingredient_ids)) + max_missing,
+        missing__lte=max_missing
+    ).order_by('missing', '-matched', '-id').values_list(
+        'id', 'matched', 'missing'
+    )
+
+
+class MatchIndexData:
+    """
+    Инвертированный индекс ингредиент -> id рецептов. Списки разбиты
+    по числу ингредиентов рецепта: рецепт, где их больше, чем указано
+    плюс max_missing, подойти не может, такие списки не просматриваются.
+    """
+
+    def __init__(self, version):
+        self.postings = {}
+        self.recipes = {}
+        self.version = version
+        self.synced_at = None
+
+    @classmethod
+    def load(cls):
+        data = cls(get_recipes_version())
+        data.synced_at = Recipe.objects.aggregate(Max('updated_at'))[
+            'updated_at__max'
+        ]
+        recipes = {}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator():
+            recipes.setdefault(recipe_id, array('i')).append(ingredient_id)
+        for recipe_id, ingredients in recipes.items():
+            data.replace(recipe_id, ingredients)
+        return data
+
+    def update(self, version):
+        """Догружает рецепты, изменённые после прошлой синхронизации."""
+        changed = Recipe.objects.all()
+        if self.synced_at is not None:
+            changed = changed.filter(
+                updated_at__gte=self.synced_at - SYNC_MARGIN
+            )
+        synced_at = changed.aggregate(Max('updated_at'))['updated_at__max']
+        recipes = {recipe_id: array('i') for recipe_id in changed.values_list(
+            'id', flat=True
+        )}
+        for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+            recipe__in=changed
+        ).values_list('recipe_id', 'ingredient_id'):
+            recipes[recipe_id].append(ingredient_id)
+        for recipe_id, ingredients in recipes.items():
+            self.replace(recipe_id, ingredients)
+        self.version = version
+        if synced_at is not None:
+            self.synced_at = synced_at
+
+    def replace(self, recipe_id, ingredients):
+        """Ингредиенты рецепта хранятся компактным массивом int."""
+        old = self.recipes.pop(recipe_id, ())
+        for ingredient_id in old:
+            self.postings[ingredient_id][len(old)].remove(recipe_id)
+        for ingredient_id in ingredients:
+            self.postings.setdefault(ingredient_id, {}).setdefault(
+                len(ingredients), array('i')
+            ).append(recipe_id)
+        if ingredients:
+            self.recipes[recipe_id] = ingredients
+
+    def match(self, ingredient_ids, max_missing):
+        max_size = len(ingredient_ids) + max_missing
+        hits = Counter()
+        for ingredient_id in ingredient_ids:
+            postings = self.postings.get(ingredient_id, {})
+            for size, recipes in postings.items():
+                if size <= max_size:
+                    hits.update(recipes)
+        results = []
+        for recipe_id, matched in hits.items():
+            missing = len(self.recipes[recipe_id]) - matched
+            if missing <= max_missing:
+                results.append((recipe_id, matched, missing))
+        return results
+
+
+class RecipeMatchIndex:
+    """
+    Индекс в памяти процесса. Строится не в запросе, а в фоновом потоке
+    при старте воркера и перестраивается там же раз в
+    RECIPE_MATCH_INDEX_TTL; пока его нет, подбор идёт запросом к базе.
+    При смене версии рецептов догружает изменённые рецепты.
+    """
+
+    def __init__(self):
+        self._data = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if settings.RECIPE_MATCH_INDEX_ASYNC:
+            threading.Thread(
+                target=self._rebuild_forever,
+                name='recipe-match-index',
+                daemon=True
+            ).start()
+        else:
+            self._rebuild()
+
+    def _rebuild(self):
+        data = MatchIndexData.load()
+        with self._lock:
+            self._data = data
+
+    def _rebuild_forever(self):
+        while True:
+            try:
+                self._rebuild()
+            except Exception:
+                logger.exception('Не удалось построить индекс рецептов')
+            finally:
+                connection.close()
+            time.sleep(settings.RECIPE_MATCH_INDEX_TTL)
+
+    def discard(self, recipe_id):
+        with self._lock:
+            if self._data is not None:
+                self._data.replace(recipe_id, ())
+
+    def match(self, ingredient_ids, max_missing):
+        """
+        Рецепты хотя бы с одним из ингредиентов, где не хватает
+        не больше max_missing: [(id, совпало, не хватает)].
+        """
+        self.start()
+        if self._data is None:
+            return match_recipes(ingredient_ids, max_missing)
+        version = get_recipes_version()
+        with self._lock:
+            if version != self._data.version:
+                self._data.update(version)
+            results = self._data.match(set(ingredient_ids), max_missing)
+        results.sort(key=lambda item: (item[2], -item[1], -item[0]))
+        return results
+
+
+recipe_match_index = RecipeMatchIndex()
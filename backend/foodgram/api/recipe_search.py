@@ -0,0 +1,131 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Q
+from django.utils.html import escape
+
+from recipes.models import Recipe
+from recipes.search import FTS_TABLE, get_search_vector
+
+SNIPPET_WORDS = 12
+SNIPPET_CHARS = 80
+START_SEL, STOP_SEL = '<b>', '</b>'
+# Метки совпадений от базы: текст экранируется, потом метки -> <b>
+START_MARK, STOP_MARK = '\x02', '\x03'
+
+
+@lru_cache(maxsize=None)
+def has_fts_table(using):
+    return FTS_TABLE in connections[using].introspection.table_names()
+
+
+def get_backend(using):
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return 'postgresql'
+    if vendor == 'sqlite' and has_fts_table(using):
+        return 'sqlite'
+    return None
+
+
+def get_fts_query(value):
+    """Каждое слово запроса - префикс, все слова обязательны."""
+    words = re.findall(r'\w+', value)
+    return ' '.join('"{}"*'.format(word) for word in words)
+
+
+def search_recipes(queryset, value):
+    """Полнотекстовый поиск по названию, описанию и ингредиентам."""
+    table = Recipe._meta.db_table
+    backend = get_backend(queryset.db)
+    if backend == 'postgresql':
+        vector = get_search_vector(table)
+        query = f"plainto_tsquery('{settings.RECIPE_SEARCH_CONFIG}', %s)"
+        return queryset.extra(
+            select={'search_rank': f'ts_rank({vector}, {query})'},
+            select_params=(value,),
+            where=[f'{vector} @@ {query}'],
+            params=(value,)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    if backend == 'sqlite':
+        query = get_fts_query(value)
+        if not query:
+            return queryset.none()
+        return queryset.extra(
+            select={'search_rank': (
+                f'SELECT -bm25({FTS_TABLE}, 10.0, 1.0) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = {table}.id'
+            )},
+            select_params=(query,),
+            where=[
+                f'{table}.id IN (SELECT rowid FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s)'
+            ],
+            params=(query,)
+        ).order_by('-search_rank', '-pub_date', '-id')
+    return queryset.filter(
+        Q(name__icontains=value) | Q(search_document__icontains=value)
+    ).order_by('-pub_date', '-id')
+
+
+def add_search_snippets(recipes, value):
+    """Фрагменты текста с подсвеченными совпадениями для страницы."""
+    if not recipes:
+        return
+    ids = [recipe.id for recipe in recipes]
+    using = recipes[0]._state.db
+    backend = get_backend(using)
+    if backend == 'postgresql':
+        config = settings.RECIPE_SEARCH_CONFIG
+        snippets = dict(Recipe.objects.using(using).filter(
+            id__in=ids
+        ).extra(
+            select={'snippet': (
+                f"ts_headline('{config}', search_document, "
+                f"plainto_tsquery('{config}', %s), %s)"
+            )},
+            select_params=(value, (
+                f'StartSel={START_MARK}, StopSel={STOP_MARK}, '
+                f'MaxWords={SNIPPET_WORDS * 2}, MinWords={SNIPPET_WORDS}'
+            ))
+        ).values_list('id', 'snippet'))
+    elif backend == 'sqlite':
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, snippet({FTS_TABLE}, 1, %s, %s, '…', "
+                f"{SNIPPET_WORDS}) FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s AND rowid IN "
+                f"({', '.join(['%s'] * len(ids))})",
+                [START_MARK, STOP_MARK, get_fts_query(value), *ids]
+            )
+            snippets = dict(cursor.fetchall())
+    else:
+        snippets = {
+            recipe_id: highlight(document, value)
+            for recipe_id, document in Recipe.objects.using(using).filter(
+                id__in=ids
+            ).values_list('id', 'search_document')
+        }
+    for recipe in recipes:
+        recipe.search_snippet = render_snippet(snippets.get(recipe.id, ''))
+
+
+def render_snippet(snippet):
+    """Текст рецепта экранируется, в HTML остаются только метки <b>."""
+    return escape(snippet).replace(START_MARK, START_SEL).replace(
+        STOP_MARK, STOP_SEL
+    )
+
+
+def highlight(document, value):
+    position = document.lower().find(value.lower())
+    if position == -1:
+        return document[:SNIPPET_CHARS]
+    start = max(position - SNIPPET_CHARS // 2, 0)
+    end = position + len(value)
+    return ''.join((
+        document[start:position], START_MARK, document[position:end],
+        STOP_MARK, document[end:end + SNIPPET_CHARS // 2],
+    ))
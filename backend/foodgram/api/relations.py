@@ -0,0 +1,199 @@
+import sqlite3
+from functools import partial
+
+from django.db import connections, router, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from rest_framework.response import Response
+
+from recipes.models import DataVersion, Favorite, Recipe, ShoppingCart
+from users.models import Follow, User
+from .cache import invalidate_user_flags
+from .serializers import BatchSerializer
+
+CREATED = 'created'
+DELETED = 'deleted'
+EXISTS = 'exists'
+MISSING = 'missing'
+NOT_FOUND = 'not_found'
+SELF = 'self'
+
+RELATIONS = {
+    Favorite: ('recipe', Recipe, 'favorites_count'),
+    ShoppingCart: ('recipe', Recipe, None),
+    Follow: ('following', User, 'followers_count'),
+}
+
+
+def relation_changed(model, user_id, target_ids, delta):
+    """
+    bulk_create и удаление без выборки не отправляют сигналы моделей:
+    счётчики, версия данных и кэш пользователя обновляются здесь.
+    """
+    _, target_model, counter = RELATIONS[model]
+    changes = {}
+    if counter is not None:
+        value = F(counter) + delta
+        if delta < 0:
+            value = Greatest(value, 0)
+        changes[counter] = value
+    if target_model is Recipe and delta < 0:
+        changes['trending_stale'] = True
+    if changes:
+        target_model.objects.filter(id__in=target_ids).update(**changes)
+    DataVersion.bump(f'user:{user_id}')
+    transaction.on_commit(partial(invalidate_user_flags, user_id))
+
+
+def can_return_rows(connection):
+    """INSERT/DELETE ... RETURNING: PostgreSQL и SQLite с версии 3.35."""
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return connection.vendor == 'postgresql'
+
+
+def insert_relations(model, user_id, target_ids):
+    """
+    INSERT ... ON CONFLICT DO NOTHING: вернёт id объектов, связи с
+    которыми действительно созданы, а не были добавлены параллельно.
+    """
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    meta = model._meta
+    target = quote(meta.get_field(RELATIONS[model][0]).column)
+    unique = f'{quote(meta.get_field("user").column)}, {target}'
+    columns, extra = unique, []
+    if any(field.name == 'created_at' for field in meta.fields):
+        columns += f', {quote(meta.get_field("created_at").column)}'
+        extra.append(
+            connection.ops.adapt_datetimefield_value(timezone.now())
+        )
+    row = '({})'.format(', '.join(['%s'] * (len(extra) + 2)))
+    sql = (
+        f'INSERT INTO {quote(meta.db_table)} ({columns}) VALUES {{}} '
+        f'ON CONFLICT ({unique}) DO NOTHING'
+    )
+    with connection.cursor() as cursor:
+        if can_return_rows(connection):
+            cursor.execute(
+                sql.format(', '.join([row] * len(target_ids)))
+                + f' RETURNING {target}',
+                [
+                    value for target_id in target_ids
+                    for value in (user_id, target_id, *extra)
+                ]
+            )
+            return [target_id for target_id, in cursor.fetchall()]
+        created = []
+        for target_id in target_ids:
+            cursor.execute(sql.format(row), [user_id, target_id, *extra])
+            if cursor.rowcount:
+                created.append(target_id)
+        return created
+
+
+def delete_relations(model, user_id, target_ids):
+    """DELETE связей: вернёт id объектов, связи с которыми удалены."""
+    using = router.db_for_write(model)
+    connection = connections[using]
+    field = RELATIONS[model][0]
+    if not can_return_rows(connection):
+        return [
+            target_id for target_id in target_ids
+            if model.objects.filter(
+                user_id=user_id, **{f'{field}_id': target_id}
+            )._raw_delete(using)
+        ]
+    quote = connection.ops.quote_name
+    meta = model._meta
+    target = quote(meta.get_field(field).column)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(meta.db_table)} '
+            f'WHERE {quote(meta.get_field("user").column)} = %s '
+            f'AND {target} IN ({", ".join(["%s"] * len(target_ids))}) '
+            f'RETURNING {target}',
+            [user_id, *target_ids]
+        )
+        return [target_id for target_id, in cursor.fetchall()]
+
+
+def toggle_relation(model, user, target_id, add):
+    """
+    Одним запросом добавляет или удаляет связь, без гонки между проверкой
+    и записью. Вернёт False, если связь уже была или её не было.
+    """
+    write = insert_relations if add else delete_relations
+    with transaction.atomic():
+        changed = write(model, user.id, [target_id])
+        if changed:
+            relation_changed(model, user.id, changed, 1 if add else -1)
+    return bool(changed)
+
+
+def get_found(model, ids):
+    _, target_model, _ = RELATIONS[model]
+    found = set(target_model.objects.filter(
+        id__in=ids
+    ).values_list('id', flat=True))
+    return [target_id for target_id in ids if target_id in found]
+
+
+def get_results(ids, found, changed, done, not_done):
+    found, changed = set(found), set(changed)
+    return {
+        target_id: (
+            NOT_FOUND if target_id not in found
+            else done if target_id in changed
+            else not_done
+        )
+        for target_id in ids
+    }
+
+
+def add_relations(model, user, ids):
+    """
+    Добавляет пачку связей, вернёт {id: статус} в порядке запроса.
+    Счётчики меняются только для действительно созданных связей.
+    """
+    found = get_found(model, ids)
+    if model is Follow and user.id in found:
+        found.remove(user.id)
+    created = []
+    if found:
+        with transaction.atomic():
+            created = insert_relations(model, user.id, found)
+            if created:
+                relation_changed(model, user.id, created, 1)
+    results = get_results(ids, found, created, CREATED, EXISTS)
+    if model is Follow and user.id in results:
+        results[user.id] = SELF
+    return results
+
+
+def remove_relations(model, user, ids):
+    """Удаляет пачку связей одним DELETE, вернёт {id: статус}."""
+    found = get_found(model, ids)
+    deleted = []
+    if found:
+        with transaction.atomic():
+            deleted = delete_relations(model, user.id, found)
+            if deleted:
+                relation_changed(model, user.id, deleted, -1)
+    return get_results(ids, found, deleted, DELETED, MISSING)
+
+
+def batch_response(request, model):
+    """POST добавляет, DELETE удаляет связи с объектами из списка ids."""
+    serializer = BatchSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = list(dict.fromkeys(serializer.validated_data['ids']))
+    if request.method == 'POST':
+        results = add_relations(model, request.user, ids)
+    else:
+        results = remove_relations(model, request.user, ids)
+    return Response({'results': [
+        {'id': target_id, 'status': result}
+        for target_id, result in results.items()
+    ]})
@@ -0,0 +1,34 @@
+import json
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+from .shopping_cart import PDF_AVAILABLE
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Выбирает формат списка покупок, ответ формирует сам view."""
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data, ensure_ascii=False).encode(self.charset)
+
+
+class TxtRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CsvRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+
+class PdfRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    render_style = 'binary'
+
+
+SHOPPING_CART_RENDERERS = [TxtRenderer, CsvRenderer, JSONRenderer]
+if PDF_AVAILABLE:
+    SHOPPING_CART_RENDERERS.append(PdfRenderer)
@@ -1,13 +1,25 @@
 import base64
 
+from django.conf import settings
 from django.core.files.base import ContentFile
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import prefetch_related_objects
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
 
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
-from users.serializers import AuthorSerializer, UserSerializer
+                            RecipeNutrition, ShoppingCart, Tag)
+from recipes.nutrition import update_recipe_nutrition
+from recipes.search import build_search_document
+from users.serializers import AuthorSerializer
+from .images import (get_image_variants, schedule_thumbnails,
+                     validate_base64_image)
+
+OPTIONAL_RECIPE_FIELDS = (
+    'search_snippet',
+    'matched_ingredients',
+    'missing_ingredients',
+)
 
 
 class Base64ImageField(serializers.ImageField):
@@ -15,6 +27,7 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
+            validate_base64_image(imgstr)
             data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
         return super(Base64ImageField, self).to_internal_value(data)
 
@@ -66,14 +79,38 @@ class TagSerializer(serializers.ModelSerializer):
         )
 
 
-class TagsField(serializers.PrimaryKeyRelatedField):
+class WriteRecipeIngredientSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    amount = serializers.IntegerField(
+        min_value=1,
+        error_messages={
+            'min_value': 'Количество ингредиента должно быть больше 0!'
+        }
+    )
+
+
+class NutritionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = RecipeNutrition
+        fields = (
+            'calories',
+            'proteins',
+            'fats',
+            'carbohydrates',
+            'cost',
+            'is_complete'
+        )
 
-    def to_representation(self, value):
-        return TagSerializer(value).data
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for field in ('calories', 'proteins', 'fats', 'carbohydrates'):
+            data[field] = round(data[field], 1)
+        return data
 
 
-class WriteRecipeSerializer(serializers.ModelSerializer):
+class ReadRecipeSerializer(serializers.ModelSerializer):
     author = AuthorSerializer(read_only=True)
+    tags = TagSerializer(read_only=True, many=True)
     ingredients = serializers.SerializerMethodField(
         method_name='get_ingredients'
     )
@@ -88,9 +125,11 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField(
         max_length=None
     )
-    tags = TagsField(
-        queryset=Tag.objects.all(),
-        many=True
+    image_variants = serializers.SerializerMethodField(
+        method_name='get_image_variants'
+    )
+    nutrition = serializers.SerializerMethodField(
+        method_name='get_nutrition'
     )
 
     class Meta:
@@ -104,111 +143,140 @@ class WriteRecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_variants',
             'text',
-            'cooking_time'
+            'cooking_time',
+            'nutrition'
         )
-        read_only_fields = [
-            'author',
-            'is_favorited',
-            'is_in_shopping_cart'
-        ]
 
-    def validate_ingredients(self, value):
-        if not value:
-            raise ValidationError({
-                'ingredients': 'Нужен хотя бы один ингредиент!'
-            })
-        ingredients_list = []
-        for item in value:
-            ingredient = get_object_or_404(Ingredient, id=item['id'])
-            if ingredient in ingredients_list:
-                raise ValidationError({
-                    'ingredients': 'Ингридиенты не должны повторяться!'
-                })
-            if int(item['amount']) <= 0:
-                raise ValidationError({
-                    'amount': 'Количество ингредиента должно быть больше 0!'
-                })
-            ingredients_list.append(ingredient)
-        return value
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for field in OPTIONAL_RECIPE_FIELDS:
+            if hasattr(instance, field):
+                data[field] = getattr(instance, field)
+        return data
 
     def get_ingredients(self, obj):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe=obj
-        )
         return RecipeIngredientSerializer(
-            ingredients,
+            obj.recipe_ingredient.all(),
             many=True).data
 
-    def get_is_favorited(self, obj):
-        return favorite_or_shop_cart(self.context, obj, Favorite)
+    def get_image_variants(self, obj):
+        return get_image_variants(obj, self.context.get('request'))
 
-    def get_is_in_shopping_cart(self, obj):
-        return favorite_or_shop_cart(self.context, obj, ShoppingCart)
+    def get_nutrition(self, obj):
+        try:
+            return NutritionSerializer(obj.nutrition).data
+        except RecipeNutrition.DoesNotExist:
+            return None
 
-    def create(self, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        recipe = Recipe.objects.create(**validated_data)
-        for ingredient_data in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_data.get('id')
-            )
-            amount = int(ingredient_data.get('amount'))
-            RecipeIngredient.objects.create(
-                recipe=recipe,
-                ingredient=ingredient,
-                amount=amount
-            )
-        for tag in tags:
-            recipe.tags.add(tag)
-        return recipe
+    def get_is_favorited(self, obj):
+        return favorite_or_shop_cart(self.context, obj, Favorite, 'favorited')
 
-    def update(self, instance, validated_data):
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        super().update(instance, validated_data)
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        instance.tags.clear()
-        for ingredient_data in ingredients:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_data.get('id')
-            )
-            RecipeIngredient.objects.create(
-                recipe=instance,
-                ingredient=ingredient,
-                amount=ingredient_data.get('amount')
-            )
-        for tag in tags:
-            instance.tags.add(tag)
-        instance.save()
-        return instance
+    def get_is_in_shopping_cart(self, obj):
+        return favorite_or_shop_cart(
+            self.context, obj, ShoppingCart, 'in_shopping_cart'
+        )
 
 
-class ReadRecipeSerializer(WriteRecipeSerializer):
-    author = UserSerializer(read_only=True)
-    tags = TagSerializer(read_only=True, many=True)
+class WriteRecipeSerializer(serializers.ModelSerializer):
+    ingredients = WriteRecipeIngredientSerializer(
+        many=True
+    )
+    image = Base64ImageField(
+        max_length=None
+    )
+    tags = serializers.PrimaryKeyRelatedField(
+        queryset=Tag.objects.all(),
+        many=True
+    )
 
     class Meta:
         model = Recipe
         fields = (
             'id',
             'tags',
-            'author',
             'ingredients',
-            'is_favorited',
-            'is_in_shopping_cart',
             'name',
             'image',
             'text',
             'cooking_time'
         )
 
+    def validate_ingredients(self, value):
+        if not value:
+            raise ValidationError('Нужен хотя бы один ингредиент!')
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингридиенты не должны повторяться!')
+        ingredients = Ingredient.objects.in_bulk(ids)
+        if len(ingredients) != len(ids):
+            raise ValidationError('Такого ингредиента не существует!')
+        return [
+            {'ingredient': ingredients[item['id']], 'amount': item['amount']}
+            for item in value
+        ]
+
+    @transaction.atomic
+    def create(self, validated_data):
+        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags')
+        recipe = Recipe.objects.create(
+            search_document=build_search_document(
+                validated_data['text'],
+                [item['ingredient'].name for item in ingredients]
+            ),
+            **validated_data
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, **item) for item in ingredients
+        )
+        recipe.tags.set(tags)
+        update_recipe_nutrition([recipe.id])
+        schedule_thumbnails(recipe)
+        return recipe
+
+    @transaction.atomic
+    def update(self, instance, validated_data):
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        if 'image' in validated_data:
+            instance.thumbnails_ready = False
+        if 'text' in validated_data or ingredients is not None:
+            if ingredients is not None:
+                names = [item['ingredient'].name for item in ingredients]
+            else:
+                names = instance.recipe_ingredient.values_list(
+                    'ingredient__name', flat=True
+                )
+            instance.search_document = build_search_document(
+                validated_data.get('text', instance.text), names
+            )
+        super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_thumbnails(instance)
+        if ingredients is not None:
+            update_recipe_ingredients(instance, ingredients)
+            update_recipe_nutrition([instance.id])
+            instance.nutrition = RecipeNutrition.objects.get(recipe=instance)
+        if tags is not None:
+            instance.tags.set(tags)
+        return instance
+
+    def to_representation(self, instance):
+        prefetch_related_objects(
+            [instance],
+            'tags',
+            'recipe_ingredient__ingredient'
+        )
+        return ReadRecipeSerializer(instance, context=self.context).data
+
 
 class CartSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = serializers.SerializerMethodField(
+        method_name='get_image_variants'
+    )
 
     class Meta:
         model = Recipe
@@ -216,11 +284,47 @@ class CartSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_variants',
             'cooking_time'
         )
 
+    def get_image_variants(self, obj):
+        return get_image_variants(obj, self.context.get('request'))
+
+
+class BatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BATCH_MAX_SIZE
+    )
+
+
+def update_recipe_ingredients(recipe, ingredients):
+    current = {
+        item.ingredient_id: item for item in recipe.recipe_ingredient.all()
+    }
+    new = {item['ingredient'].id: item for item in ingredients}
+    RecipeIngredient.objects.filter(
+        recipe=recipe,
+        ingredient_id__in=current.keys() - new.keys()
+    ).delete()
+    RecipeIngredient.objects.bulk_create(
+        RecipeIngredient(recipe=recipe, **new[ingredient_id])
+        for ingredient_id in new.keys() - current.keys()
+    )
+    changed = []
+    for ingredient_id in current.keys() & new.keys():
+        item = current[ingredient_id]
+        if item.amount != new[ingredient_id]['amount']:
+            item.amount = new[ingredient_id]['amount']
+            changed.append(item)
+    RecipeIngredient.objects.bulk_update(changed, ['amount'])
+
 
-def favorite_or_shop_cart(context, obj, model):
+def favorite_or_shop_cart(context, obj, model, annotation):
+    if hasattr(obj, annotation):
+        return getattr(obj, annotation)
     user = context.get('request').user
     if user.is_anonymous:
         return False
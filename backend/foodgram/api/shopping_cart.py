@@ -0,0 +1,172 @@
+import csv
+import json
+import os
+from io import BytesIO
+from itertools import chain
+
+from django.conf import settings
+from django.db.models import Count, F, FloatField, Q, Sum
+
+from recipes.models import RecipeIngredient, RecipeNutrition
+from recipes.units import get_base_factor, get_base_unit, humanize
+
+try:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.pdfgen import canvas
+    # Встроенные шрифты reportlab не умеют кириллицу
+    PDF_AVAILABLE = os.path.exists(settings.SHOPPING_CART_PDF_FONT)
+except ImportError:
+    PDF_AVAILABLE = False
+
+CHUNK_SIZE = 8192
+PDF_FONT_NAME = 'ShoppingCartFont'
+
+
+class Echo:
+    """Буфер для csv.writer, который сразу возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def get_shopping_cart_ingredients(user):
+    """
+    Один запрос на всю корзину: количества переводятся в основные единицы
+    и суммируются в базе, в Python только выбирается удобная единица.
+    """
+    rows = RecipeIngredient.objects.filter(
+        recipe__shopping_cart__user=user
+    ).values(
+        name=F('ingredient__name'),
+        measurement_unit=get_base_unit()
+    ).annotate(
+        amount=Sum(F('amount') * get_base_factor(), output_field=FloatField())
+    ).order_by('name', 'measurement_unit')
+    for row in rows.iterator():
+        row['amount'], row['measurement_unit'] = humanize(
+            row['amount'], row['measurement_unit']
+        )
+        yield row
+
+
+def get_shopping_cart_totals(user):
+    """Итоги корзины по готовым сводкам рецептов, без обхода ингредиентов."""
+    totals = RecipeNutrition.objects.filter(
+        recipe__shopping_cart__user=user
+    ).aggregate(
+        calories=Sum('calories'),
+        proteins=Sum('proteins'),
+        fats=Sum('fats'),
+        carbohydrates=Sum('carbohydrates'),
+        cost=Sum('cost'),
+        incomplete=Count('pk', filter=Q(is_complete=False))
+    )
+    if not totals['calories'] and not totals['cost']:
+        return None
+    return totals
+
+
+def get_totals_rows(totals):
+    """[(показатель, единицы, значение)] для вывода в конце списка."""
+    rows = [
+        ('Калории', 'ккал', round(totals['calories'])),
+        ('Белки', 'г', round(totals['proteins'])),
+        ('Жиры', 'г', round(totals['fats'])),
+        ('Углеводы', 'г', round(totals['carbohydrates'])),
+        ('Стоимость', 'руб.', totals['cost']),
+    ]
+    if totals['incomplete']:
+        rows.append(
+            ('Рецептов с неполными данными', 'шт', totals['incomplete'])
+        )
+    return rows
+
+
+def txt_stream(user, ingredients, totals):
+    yield f'{user.username} вот твой список покупок \n'
+    for item in ingredients:
+        yield (
+            f'{item["name"]} '
+            f'({item["measurement_unit"]}) '
+            f'- {item["amount"]}\n'
+        )
+    if totals is not None:
+        yield '\nИтого:\n'
+        for name, unit, value in get_totals_rows(totals):
+            yield f'{name} ({unit}) - {value}\n'
+    yield 'foodgram'
+
+
+def csv_stream(user, ingredients, totals):
+    writer = csv.writer(Echo())
+    yield writer.writerow(('Ингредиент', 'Единицы измерения', 'Количество'))
+    for item in ingredients:
+        yield writer.writerow(
+            (item['name'], item['measurement_unit'], item['amount'])
+        )
+    if totals is not None:
+        yield writer.writerow(())
+        for row in get_totals_rows(totals):
+            yield writer.writerow(row)
+
+
+def json_stream(user, ingredients, totals):
+    separator = ''
+    yield '['
+    for item in ingredients:
+        yield separator + json.dumps(item, ensure_ascii=False)
+        separator = ','
+    yield ']'
+
+
+def pdf_stream(user, ingredients, totals):
+    font = PDF_FONT_NAME
+    if font not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont(font, settings.SHOPPING_CART_PDF_FONT))
+    buffer = BytesIO()
+    document = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    y = height - 50
+    document.setFont(font, 14)
+    document.drawString(50, y, f'{user.username} вот твой список покупок')
+    document.setFont(font, 11)
+    lines = (
+        f'{item["name"]} ({item["measurement_unit"]}) - {item["amount"]}'
+        for item in ingredients
+    )
+    if totals is not None:
+        lines = chain(lines, ['', 'Итого:'], (
+            f'{name} ({unit}) - {value}'
+            for name, unit, value in get_totals_rows(totals)
+        ))
+    for line in lines:
+        y -= 18
+        if y < 50:
+            document.showPage()
+            document.setFont(font, 11)
+            y = height - 50
+        document.drawString(50, y, line)
+    document.save()
+    buffer.seek(0)
+    chunk = buffer.read(CHUNK_SIZE)
+    while chunk:
+        yield chunk
+        chunk = buffer.read(CHUNK_SIZE)
+
+
+SHOPPING_CART_STREAMS = {
+    'txt': txt_stream,
+    'csv': csv_stream,
+    'json': json_stream,
+    'pdf': pdf_stream,
+}
+
+
+def shopping_cart_stream(file_format, user):
+    """JSON остаётся списком ингредиентов: итоги есть в остальных форматах."""
+    ingredients = get_shopping_cart_ingredients(user)
+    return SHOPPING_CART_STREAMS[file_format](
+        user, ingredients, get_shopping_cart_totals(user)
+    )
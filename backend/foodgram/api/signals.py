@@ -0,0 +1,62 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from recipes.models import (DataVersion, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from recipes.signals import bulk_changed
+from users.models import Follow
+from .cache import invalidate_user_flags
+from .feed import fan_out_recipe, get_author_version_name
+from .filters import tag_slugs
+from .ingredient_search import ingredient_index
+from .recipe_matching import recipe_match_index
+
+
+@receiver([post_save, post_delete, bulk_changed], sender=Ingredient)
+def invalidate_ingredient_index(sender, **kwargs):
+    DataVersion.bump('ingredients')
+    transaction.on_commit(ingredient_index.invalidate)
+
+
+@receiver([post_save, post_delete, bulk_changed], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    DataVersion.bump('tags')
+    transaction.on_commit(tag_slugs.invalidate)
+
+
+@receiver([post_save, post_delete, bulk_changed], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def invalidate_recipes(sender, **kwargs):
+    DataVersion.bump('recipes')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+def invalidate_author_recipes(sender, instance, created=True, **kwargs):
+    """
+    В ленте - только дата и автор рецепта: версия меняется при
+    создании и удалении, а не при правке или готовности превью.
+    """
+    if created:
+        DataVersion.bump(get_author_version_name(instance.author_id))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_new_recipe(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(fan_out_recipe, instance.id))
+
+
+@receiver(post_delete, sender=Recipe)
+def discard_matched_recipe(sender, instance, **kwargs):
+    transaction.on_commit(partial(recipe_match_index.discard, instance.id))
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Follow)
+def invalidate_flags(sender, instance, **kwargs):
+    DataVersion.bump(f'user:{instance.user_id}')
+    transaction.on_commit(partial(invalidate_user_flags, instance.user_id))
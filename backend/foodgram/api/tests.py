@@ -0,0 +1,864 @@
+import base64
+import json
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+
+from recipes.models import (DataVersion, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from users.models import Follow, User
+from .filters import tag_slugs
+from .ingredient_search import ingredient_index
+from .recipe_matching import RecipeMatchIndex
+from .shopping_cart import PDF_AVAILABLE
+from .views import RecipeViewSet
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+class RecipeListQueriesTest(APITestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        author = User.objects.create(username='author', email='a@ya.ru')
+        Follow.objects.create(user=cls.user, following=author)
+        tags = [
+            Tag.objects.create(name=f'Тэг {number}', slug=f'tag{number}',
+                               color=f'#00000{number}')
+            for number in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(3)
+        ]
+        for number in range(200):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', image='recipe.png',
+                text='Описание', cooking_time=10
+            )
+            recipe.tags.set(tags)
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                                 amount=100)
+                for ingredient in ingredients
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def assert_queries_for_sizes(self, params):
+        """Страница из 6, 50 и 200 рецептов - одно и то же число запросов."""
+        pagination_class = RecipeViewSet.pagination_class
+        # Первый запрос заполняет данные в памяти процесса (slug тэгов)
+        self.client.get('/api/recipes/', params)
+        cache.clear()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get('/api/recipes/', params)
+        for size in (6, 50, 200):
+            with self.subTest(size=size), mock.patch.object(
+                pagination_class, 'page_size', size
+            ):
+                cache.clear()
+                with self.assertNumQueries(len(context)):
+                    response = self.client.get('/api/recipes/', params)
+                yield size, response.data['results']
+
+    def test_list_queries(self):
+        for size, results in self.assert_queries_for_sizes({}):
+            self.assertEqual(len(results), size)
+
+    def test_favorited_list_queries(self):
+        for size, results in self.assert_queries_for_sizes(
+            {'is_favorited': 1}
+        ):
+            self.assertEqual(len(results), min(size, 100))
+            self.assertTrue(all(
+                recipe['is_favorited'] and recipe['is_in_shopping_cart']
+                and recipe['author']['is_subscribed']
+                for recipe in results
+            ))
+
+
+class ConditionalCacheTest(APITestCase):
+    """Ответ из кэша и ETag строятся по одним версиям данных."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Суп', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+
+    def test_write_from_another_process(self):
+        cache.clear()
+        response = self.client.get('/api/recipes/')
+        etag = response['ETag']
+        # Другой воркер: версия в базе меняется, его кэш нам не виден
+        Recipe.objects.filter(pk=self.recipe.pk).update(name='Борщ')
+        DataVersion.bump('recipes')
+        response = self.client.get('/api/recipes/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['name'], 'Борщ')
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+
+class MetricsTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        cls.admin = User.objects.create(
+            username='admin', email='admin@ya.ru', is_staff=True
+        )
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Суп', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+
+    def test_metrics_for_admins_only(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_authenticate(self.admin)
+        response = self.client.get('/api/metrics/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'foodgram_requests_total', response.content)
+
+    def test_first_favorite_within_budget(self):
+        self.client.force_authenticate(self.user)
+        url = f'/api/recipes/{self.recipe.id}/favorite/'
+        budget = RecipeViewSet.query_budget['favorite']
+        with override_settings(QUERY_BUDGET_STRICT=True):
+            with self.assertNumQueries(budget):
+                response = self.client.post(url)
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(self.client.delete(url).status_code, 204)
+
+    def test_streaming_queries_counted(self):
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.client.force_authenticate(self.user)
+        with mock.patch('api.metrics.registry.observe') as observe, \
+                CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                '/api/recipes/download_shopping_cart/'
+            )
+            view_queries = len(context)
+            observe.assert_not_called()
+            b''.join(response.streaming_content)
+        self.assertGreater(len(context), view_queries)
+        observe.assert_called_once()
+        metrics = observe.call_args[0][3]
+        self.assertEqual(metrics.queries, len(context))
+        self.assertLessEqual(metrics.queries, metrics.query_budget)
+
+
+class SearchSnippetTest(APITestCase):
+
+    def test_snippet_is_escaped(self):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        text = 'tasty <img src=x onerror=alert(1)> soup'
+        Recipe.objects.create(
+            author=author, name='Суп', image='recipe.png', text=text,
+            search_document=text, cooking_time=10
+        )
+        response = self.client.get('/api/recipes/', {'search': 'soup'})
+        snippet = response.data['results'][0]['search_snippet']
+        self.assertNotIn('<img', snippet)
+        self.assertIn('&lt;img', snippet)
+        self.assertIn('<b>soup</b>', snippet)
+
+
+class RecipeTagFilterTest(APITestCase):
+    """Фильтр по многим тэгам: без дублей на страницах, any и all."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.tags = [
+            Tag.objects.create(name=f'Тэг {number}', slug=f'tag{number}',
+                               color=f'#0000{number:02}')
+            for number in range(10)
+        ]
+        cls.recipe_tags = {}
+        for number in range(25):
+            recipe = Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', image='recipe.png',
+                text='Описание', cooking_time=10
+            )
+            tags = [
+                tag for index, tag in enumerate(cls.tags)
+                if (number + index) % 3
+            ][:number % 8]
+            recipe.tags.set(tags)
+            cls.recipe_tags[recipe.id] = {tag.slug for tag in tags}
+
+    def setUp(self):
+        cache.clear()
+        tag_slugs.invalidate()
+
+    def get_all_pages(self, params):
+        ids, page = [], 1
+        while True:
+            response = self.client.get(
+                '/api/recipes/', {**params, 'limit': 4, 'page': page}
+            )
+            self.assertEqual(response.status_code, 200)
+            ids.extend(recipe['id'] for recipe in response.data['results'])
+            if response.data['next'] is None:
+                return ids, response.data['count']
+            page += 1
+
+    def assert_pages(self, params, expected):
+        ids, count = self.get_all_pages(params)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(set(ids), expected)
+        self.assertEqual(count, len(expected))
+
+    def test_any_of_many_tags(self):
+        slugs = [tag.slug for tag in self.tags]
+        self.assert_pages({'tags': slugs}, {
+            recipe_id for recipe_id, tags in self.recipe_tags.items()
+            if tags
+        })
+
+    def test_all_tags(self):
+        slugs = ['tag1', 'tag2', 'tag4']
+        self.assert_pages({'tags': slugs, 'tags_mode': 'all'}, {
+            recipe_id for recipe_id, tags in self.recipe_tags.items()
+            if tags >= set(slugs)
+        })
+
+    def test_tag_created_in_another_process(self):
+        self.assert_pages({'tags': ['tag0']}, {
+            recipe_id for recipe_id, tags in self.recipe_tags.items()
+            if 'tag0' in tags
+        })
+        # bulk_create не отправляет сигналы, как загрузка из файла
+        Tag.objects.bulk_create(
+            [Tag(name='Новый', slug='new', color='#FFFFFF')]
+        )
+        recipe_id = next(iter(self.recipe_tags))
+        Recipe.tags.through.objects.create(
+            recipe_id=recipe_id, tag=Tag.objects.get(slug='new')
+        )
+        self.assert_pages({'tags': ['new']}, {recipe_id})
+        response = self.client.get('/api/recipes/', {'tags': ['unknown']})
+        self.assertEqual(response.status_code, 400)
+
+
+class RelationBatchTest(APITestCase):
+    """Счётчики меняются только на действительно записанные связи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', image='recipe.png',
+                text='Описание', cooking_time=10
+            )
+            for number in range(3)
+        ]
+
+    def assert_counters(self):
+        for recipe in self.recipes:
+            recipe.refresh_from_db()
+            self.assertEqual(
+                recipe.favorites_count,
+                Favorite.objects.filter(recipe=recipe).count()
+            )
+
+    def test_repeated_batches(self):
+        self.client.force_authenticate(self.user)
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        url = '/api/recipes/favorite/batch/'
+        ids = [recipe.id for recipe in self.recipes]
+        for method, statuses in (
+            ('post', ['exists', 'created', 'created']),
+            ('post', ['exists', 'exists', 'exists']),
+            ('delete', ['deleted', 'deleted', 'deleted']),
+            ('delete', ['missing', 'missing', 'missing']),
+        ):
+            response = getattr(self.client, method)(
+                url, {'ids': ids}, format='json'
+            )
+            self.assertEqual(
+                [result['status'] for result in response.data['results']],
+                statuses
+            )
+            self.assert_counters()
+
+
+class ConcurrentFavoriteTest(TransactionTestCase):
+    """Одновременные запросы к одной паре: ровно один успешный."""
+
+    threads = 8
+
+    def setUp(self):
+        if connection.vendor == 'sqlite' and connection.is_in_memory_db():
+            self.skipTest('Потокам нужна общая база в файле')
+        self.user = User.objects.create(username='user', email='u@ya.ru')
+        author = User.objects.create(username='author', email='a@ya.ru')
+        self.recipe = Recipe.objects.create(
+            author=author, name='Суп', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+        self.url = f'/api/recipes/{self.recipe.id}/favorite/'
+
+    def request_all(self, method):
+        barrier = threading.Barrier(self.threads)
+
+        def send():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(self.url).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = [executor.submit(send) for _ in range(self.threads)]
+            return sorted(future.result() for future in futures)
+
+    def assert_favorites(self, count):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, count)
+        self.assertEqual(
+            Favorite.objects.filter(recipe=self.recipe).count(), count
+        )
+
+    def test_same_pair_from_many_threads(self):
+        for _ in range(3):
+            self.assertEqual(
+                self.request_all('post'),
+                [201] + [400] * (self.threads - 1)
+            )
+            self.assert_favorites(1)
+            self.assertEqual(
+                self.request_all('delete'),
+                [204] + [400] * (self.threads - 1)
+            )
+            self.assert_favorites(0)
+
+
+class FeedTest(APITestCase):
+    """
+    В тестах on_commit не вызывается: рецепт в ленты не раздаётся,
+    как при записи в другом процессе со своим кэшем.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        cls.author = User.objects.create(username='author', email='a@ya.ru')
+        Follow.objects.create(user=cls.user, following=cls.author)
+        cls.recipes = [cls.create_recipe(number) for number in range(3)]
+
+    @classmethod
+    def create_recipe(cls, number):
+        return Recipe.objects.create(
+            author=cls.author, name=f'Рецепт {number}', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    def get_feed(self):
+        response = self.client.get('/api/recipes/feed/', {'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def test_feed_follows_database(self):
+        self.assertEqual(
+            self.get_feed(), [self.recipes[2].id, self.recipes[1].id]
+        )
+        recipe = self.create_recipe(3)
+        self.assertEqual(self.get_feed(), [recipe.id, self.recipes[2].id])
+        recipe.delete()
+        self.recipes[2].delete()
+        self.assertEqual(
+            self.get_feed(), [self.recipes[1].id, self.recipes[0].id]
+        )
+
+
+@override_settings(IMAGE_THUMBNAILS_ASYNC=False, MEDIA_ROOT=MEDIA_ROOT)
+class FeedFanOutTest(TransactionTestCase):
+    """Новый рецепт раздаётся в ленту, и превью её не сбрасывает."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='user', email='u@ya.ru')
+        self.author = User.objects.create(username='author', email='a@ya.ru')
+        Follow.objects.create(user=self.user, following=self.author)
+        ingredient = Ingredient.objects.create(name='Мука',
+                                               measurement_unit='г')
+        tag = Tag.objects.create(name='Обед', slug='lunch', color='#FFFFFF')
+        buffer = BytesIO()
+        Image.new('RGB', (4, 4)).save(buffer, 'PNG')
+        self.payload = {
+            'ingredients': [{'id': ingredient.id, 'amount': 100}],
+            'tags': [tag.id],
+            'image': 'data:image/png;base64,' + base64.b64encode(
+                buffer.getvalue()
+            ).decode(),
+            'name': 'Суп',
+            'text': 'Описание',
+            'cooking_time': 10,
+        }
+
+    def tearDown(self):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def test_pushed_timeline_stays_cached(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertEqual(client.get('/api/recipes/feed/').data['results'], [])
+        author_client = APIClient()
+        author_client.force_authenticate(self.author)
+        response = author_client.post(
+            '/api/recipes/', self.payload, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(
+            Recipe.objects.get(pk=response.data['id']).thumbnails_ready
+        )
+        with mock.patch('api.feed.query_feed') as query_feed:
+            feed = client.get('/api/recipes/feed/').data['results']
+        query_feed.assert_not_called()
+        self.assertEqual(
+            [recipe['id'] for recipe in feed], [response.data['id']]
+        )
+
+
+class RecipeOrderingTest(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.users = [
+            User.objects.create(username=f'user{number}',
+                                email=f'user{number}@ya.ru')
+            for number in range(3)
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=author, name=f'Рецепт {number}', image='recipe.png',
+                text='Описание', cooking_time=10
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def get_ids(self, ordering):
+        response = self.client.get(
+            '/api/recipes/', {'ordering': ordering, 'limit': 2}
+        )
+        self.assertEqual(response.status_code, 200)
+        return [recipe['id'] for recipe in response.data['results']]
+
+    def favorite(self, user, recipe):
+        self.client.force_authenticate(user)
+        url = f'/api/recipes/{recipe.id}/favorite/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        self.client.force_authenticate(None)
+
+    def test_trending_top_from_database(self):
+        for user in self.users:
+            self.favorite(user, self.recipes[1])
+        self.favorite(self.users[0], self.recipes[2])
+        call_command('update_trending', stdout=StringIO())
+        # Команда из cron - другой процесс со своим кэшем
+        cache.clear()
+        self.assertEqual(
+            self.get_ids('trending'), [self.recipes[1].id, self.recipes[2].id]
+        )
+        self.recipes[1].delete()
+        self.assertEqual(
+            self.get_ids('trending'), [self.recipes[2].id, self.recipes[3].id]
+        )
+
+    def test_removed_events_lower_trending(self):
+        for user in self.users[:2]:
+            self.favorite(user, self.recipes[1])
+        self.favorite(self.users[0], self.recipes[2])
+        ShoppingCart.objects.create(user=self.users[0], recipe=self.recipes[3])
+        call_command('update_trending', stdout=StringIO())
+        for user in self.users[:2]:
+            self.client.force_authenticate(user)
+            self.assertEqual(self.client.delete(
+                f'/api/recipes/{self.recipes[1].id}/favorite/'
+            ).status_code, 204)
+        ShoppingCart.objects.filter(recipe=self.recipes[3]).delete()
+        call_command('update_trending', stdout=StringIO())
+        cache.clear()
+        self.assertEqual(
+            self.get_ids('trending'), [self.recipes[2].id, self.recipes[3].id]
+        )
+        self.assertEqual(set(Recipe.objects.filter(
+            trending_score__gt=0
+        ).values_list('id', flat=True)), {self.recipes[2].id})
+        self.assertFalse(Recipe.objects.filter(trending_stale=True).exists())
+
+    def test_popular_after_favorite(self):
+        self.favorite(self.users[0], self.recipes[1])
+        self.assertEqual(self.get_ids('popular')[0], self.recipes[1].id)
+        self.favorite(self.users[0], self.recipes[2])
+        self.favorite(self.users[1], self.recipes[2])
+        self.assertEqual(self.get_ids('popular')[0], self.recipes[2].id)
+
+
+class SimilarRecipesTest(APITestCase):
+
+    def test_unknown_recipe(self):
+        for pk in ('abc', '1.5', '999'):
+            with self.subTest(pk=pk):
+                response = self.client.get(f'/api/recipes/{pk}/similar/')
+                self.assertEqual(response.status_code, 404)
+
+
+class ShoppingCartDownloadTest(APITestCase):
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.recipe = Recipe.objects.create(
+            author=author, name='Суп', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=salt, amount=5
+        )
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def download(self, **kwargs):
+        response = self.client.get(self.url, **kwargs)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def assert_attachment(self, response, file_format):
+        self.assertEqual(
+            response['Content-Disposition'],
+            f'attachment;filename="shopping_cart.{file_format}"'
+        )
+
+    def test_txt_by_default(self):
+        response, body = self.download()
+        self.assertEqual(response['Content-Type'], 'text/plain;charset=UTF-8')
+        self.assert_attachment(response, 'txt')
+        self.assertEqual(
+            body.decode(),
+            'user вот твой список покупок \nсоль (г) - 5\nfoodgram'
+        )
+
+    def test_csv_by_format_parameter(self):
+        response, body = self.download(data={'format': 'csv'})
+        self.assertEqual(response['Content-Type'], 'text/csv;charset=UTF-8')
+        self.assert_attachment(response, 'csv')
+        self.assertEqual(
+            body.decode(),
+            'Ингредиент,Единицы измерения,Количество\r\nсоль,г,5\r\n'
+        )
+
+    def test_json_by_accept_header(self):
+        response, body = self.download(HTTP_ACCEPT='application/json')
+        self.assertEqual(
+            response['Content-Type'], 'application/json;charset=UTF-8'
+        )
+        self.assert_attachment(response, 'json')
+        self.assertEqual(json.loads(body), [
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 5}
+        ])
+
+    @skipUnless(PDF_AVAILABLE, 'Нет reportlab или шрифта с кириллицей')
+    def test_pdf(self):
+        response, body = self.download(data={'format': 'pdf'})
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assert_attachment(response, 'pdf')
+        self.assertTrue(body.startswith(b'%PDF'))
+
+    def test_unknown_format(self):
+        response = self.client.get(self.url, {'format': 'xml'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_amounts_merged_across_units(self):
+        recipe = Recipe.objects.create(
+            author=self.recipe.author, name='Пирог', image='recipe.png',
+            text='Описание', cooking_time=10
+        )
+        grams = Ingredient.objects.create(name='мука', measurement_unit='г')
+        kilograms = Ingredient.objects.create(name='мука',
+                                              measurement_unit='кг')
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=self.recipe, ingredient=grams,
+                             amount=500),
+            RecipeIngredient(recipe=self.recipe, ingredient=kilograms,
+                             amount=1),
+            RecipeIngredient(recipe=recipe, ingredient=grams, amount=700),
+        ])
+        ShoppingCart.objects.create(user=self.user, recipe=recipe)
+        _, body = self.download()
+        self.assertEqual(body.decode().splitlines()[1:-1], [
+            'мука (кг) - 2.2',
+            'соль (г) - 5',
+        ])
+        _, body = self.download(data={'format': 'json'})
+        self.assertEqual(json.loads(body), [
+            {'name': 'мука', 'measurement_unit': 'кг', 'amount': 2.2},
+            {'name': 'соль', 'measurement_unit': 'г', 'amount': 5},
+        ])
+
+
+class RecipeMatchTest(APITestCase):
+    """Подбор по ингредиентам: индекс в памяти и запрос к базе до него."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(username='author', email='a@ya.ru')
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {number}',
+                                      measurement_unit='г')
+            for number in range(6)
+        ]
+        cls.recipes = {}
+        for name, numbers in (
+            ('Суп', (0, 1, 2)),
+            ('Борщ', (0, 1, 2, 3, 4)),
+            ('Каша', (4, 5)),
+            ('Чай', ()),
+        ):
+            recipe = Recipe.objects.create(
+                author=author, name=name, image='recipe.png',
+                text='Описание', cooking_time=10
+            )
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(recipe=recipe,
+                                 ingredient=cls.ingredients[number],
+                                 amount=100)
+                for number in numbers
+            )
+            cls.recipes[name] = recipe
+
+    def match(self, numbers, max_missing):
+        response = self.client.get('/api/recipes/match/', {
+            'ingredients': ','.join(
+                str(self.ingredients[number].id) for number in numbers
+            ),
+            'max_missing': max_missing,
+        })
+        self.assertEqual(response.status_code, 200)
+        return [
+            (recipe['name'], recipe['matched_ingredients'],
+             recipe['missing_ingredients'])
+            for recipe in response.data['results']
+        ]
+
+    def assert_matches(self):
+        self.assertEqual(self.match((0, 1, 2, 3), 0), [('Суп', 3, 0)])
+        self.assertEqual(
+            self.match((0, 1, 2, 3), 2), [('Суп', 3, 0), ('Борщ', 4, 1)]
+        )
+        self.assertEqual(self.match((5,), 1), [('Каша', 1, 1)])
+        self.assertEqual(self.match((5,), 0), [])
+
+    @override_settings(RECIPE_MATCH_INDEX_ASYNC=False)
+    def test_index(self):
+        index = RecipeMatchIndex()
+        with mock.patch('api.views.recipe_match_index', index):
+            self.assert_matches()
+        self.assertIsNotNone(index._data)
+
+    def test_database_before_index_is_built(self):
+        index = RecipeMatchIndex()
+        with mock.patch('api.views.recipe_match_index', index), \
+                mock.patch.object(index, 'start'):
+            self.assert_matches()
+        self.assertIsNone(index._data)
+
+
+class SubscriptionsTest(APITestCase):
+    """recipes_limit в подписках: последние рецепты каждого автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='user', email='u@ya.ru')
+        cls.recipes = {}
+        for name in ('first', 'second'):
+            author = User.objects.create(username=name, email=f'{name}@ya.ru')
+            Follow.objects.create(user=cls.user, following=author)
+            cls.recipes[name] = [
+                Recipe.objects.create(
+                    author=author, name=f'Рецепт {number}',
+                    image='recipe.png', text='Описание', cooking_time=10
+                ).id
+                for number in range(3)
+            ]
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def get_recipes(self, params):
+        response = self.client.get('/api/users/subscriptions/', params)
+        self.assertEqual(response.status_code, 200)
+        return {
+            author['username']: (
+                [recipe['id'] for recipe in author['recipes']],
+                author['recipes_count']
+            )
+            for author in response.data['results']
+        }
+
+    def test_recipes_limit(self):
+        for recipes_limit, count in (('2', 2), ('0', 0), ('', 3), ('x', 3)):
+            with self.subTest(recipes_limit=recipes_limit):
+                self.assertEqual(
+                    self.get_recipes({'recipes_limit': recipes_limit}), {
+                        name: (ids[::-1][:count], 3)
+                        for name, ids in self.recipes.items()
+                    }
+                )
+
+
+class CursorPaginationTest(APITestCase):
+    """Проход по страницам курсора без повторов и пропусков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create(username=username, email=f'{number}@ya.ru')
+            for number, username in enumerate(
+                ('boris', None, 'anna', None, 'vera')
+            )
+        ]
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.users[0], name=f'Рецепт {number}',
+                image='recipe.png', text='Описание', cooking_time=10
+            )
+            for number in range(5)
+        ]
+        Recipe.objects.filter(id__in=[
+            recipe.id for recipe in cls.recipes[1:4]
+        ]).update(pub_date=cls.recipes[0].pub_date, favorites_count=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def walk(self, url, params):
+        ids = []
+        response = self.client.get(url, {**params, 'cursor': '', 'limit': 2})
+        while True:
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            if response.data['next'] is None:
+                return ids
+            response = self.client.get(response.data['next'])
+
+    def test_users(self):
+        self.assertEqual(self.walk('/api/users/', {}), [
+            self.users[number].id for number in (2, 0, 4, 1, 3)
+        ])
+
+    def test_recipes(self):
+        recipes = Recipe.objects.in_bulk()
+        for ordering, key in (
+            ('new', lambda recipe: (recipe.pub_date, recipe.id)),
+            ('popular', lambda recipe: (recipe.favorites_count, recipe.id)),
+        ):
+            with self.subTest(ordering=ordering):
+                self.assertEqual(
+                    self.walk('/api/recipes/', {'ordering': ordering}),
+                    sorted(recipes, key=lambda pk: key(recipes[pk]),
+                           reverse=True)
+                )
+
+
+class IngredientSearchTest(TransactionTestCase):
+    """
+    Автодополнение из справочника в памяти и из базы. Справочник
+    сбрасывается после коммита, поэтому тест с транзакциями.
+    """
+
+    def setUp(self):
+        cache.clear()
+        ingredient_index.invalidate()
+        for name, unit in (
+            ('мука пшеничная', 'г'),
+            ('молоко', 'мл'),
+            ('соль', 'г'),
+            ('сахар', 'г'),
+        ):
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+
+    def tearDown(self):
+        ingredient_index.invalidate()
+
+    def search(self, name):
+        response = self.client.get('/api/ingredients/', {'name': name})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('ETag', response)
+        return [ingredient['name'] for ingredient in response.data['results']]
+
+    def test_index(self):
+        self.assertEqual(self.search('мо'), ['молоко'])
+        self.assertEqual(self.search('ПШЕ'), ['мука пшеничная'])
+        self.assertEqual(self.search('малоко'), ['молоко'])
+        self.assertIsNotNone(ingredient_index._rows)
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'мо'},
+            HTTP_IF_NONE_MATCH=self.client.get(
+                '/api/ingredients/', {'name': 'мо'}
+            )['ETag']
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_index_follows_changes(self):
+        self.assertEqual(self.search('морская'), [])
+        salt = Ingredient.objects.get(name='соль')
+        salt.name = 'соль морская'
+        salt.save()
+        self.assertEqual(self.search('морская'), ['соль морская'])
+        Ingredient.objects.create(name='мёд', measurement_unit='г')
+        self.assertEqual(self.search('мед'), ['мёд'])
+        salt.delete()
+        self.assertEqual(self.search('морская'), [])
+
+    @override_settings(INGREDIENT_SEARCH_CACHE_MAX_ROWS=1)
+    def test_database_when_index_is_too_large(self):
+        self.assertEqual(self.search('мо'), ['молоко'])
+        self.assertEqual(self.search('са'), ['сахар'])
+        self.assertEqual(ingredient_index._rows, [])
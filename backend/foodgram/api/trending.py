@@ -0,0 +1,45 @@
+from recipes.models import TrendingRecipe
+
+TOP_PARAMS = {'ordering', 'page', 'limit'}
+
+
+def get_trending_top(start, stop):
+    """id рецептов топа на местах [start, stop) из таблицы топа."""
+    return list(TrendingRecipe.objects.filter(
+        position__gte=start, position__lt=stop
+    ).order_by('position').values_list('recipe_id', flat=True))
+
+
+def is_trending_top_request(request):
+    """Общий список популярного без фильтров и курсора."""
+    params = request.query_params
+    return params.get('ordering') == 'trending' and set(params) <= TOP_PARAMS
+
+
+class TrendingRecipes:
+    """
+    Список для Paginator: страница берётся по местам в готовом топе
+    без сортировки в базе. Если мест на страницу не хватает (топ короче
+    или рецепт из него удалён), она собирается из queryset.
+    """
+
+    def __init__(self, queryset):
+        self.queryset = queryset
+
+    def count(self):
+        return self.queryset.count()
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.stop is None or key.step:
+            return self.queryset[key]
+        start = key.start or 0
+        ids = get_trending_top(start, key.stop)
+        if len(ids) < key.stop - start:
+            return self.queryset[key]
+        recipes = self.queryset.in_bulk(ids)
+        return [
+            recipes[recipe_id] for recipe_id in ids if recipe_id in recipes
+        ]
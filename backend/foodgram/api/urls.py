@@ -1,6 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
+from .metrics import metrics_view
 from .views import IngredientViewSet, RecipeViewSet, TagViewSet
 
 router = DefaultRouter()
@@ -10,6 +11,7 @@ router.register('recipes', RecipeViewSet, basename='recipe')
 router.register('tags', TagViewSet, basename='tags')
 
 urlpatterns = [
+    path('metrics/', metrics_view, name='metrics'),
     path('', include(router.urls)),
     path('auth/', include('users.urls')),
     path('users/', include('users.urls')),
@@ -1,19 +1,38 @@
-from django.http import HttpResponse
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db.models import BooleanField, Exists, OuterRef, Prefetch, Value
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            SimilarRecipe, Tag)
+from users.models import Follow, User
+from .cache import CachedResponseMixin, get_user_flags
+from .conditional import ConditionalGetMixin
+from .feed import get_feed
 from .filters import IngredientFilter, RecipeFilter
+from .ingredient_search import ingredient_index
+from .metrics import InstrumentedViewMixin
+from .pagination import (FeedPagination, PageNumberKeysetPagination,
+                         RecipePagination)
 from .permissions import IsAuthenticatedAuthorOrReadOnly
+from .recipe_matching import recipe_match_index
+from .recipe_search import add_search_snippets
+from .relations import batch_response, toggle_relation
+from .renderers import SHOPPING_CART_RENDERERS
 from .serializers import (CartSerializer, IngredientSerializer,
                           ReadRecipeSerializer, TagSerializer,
                           WriteRecipeSerializer)
+from .shopping_cart import shopping_cart_stream
+from .trending import TrendingRecipes, is_trending_top_request
 
 
 class ListRetrieveViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin,
@@ -22,25 +41,125 @@ class ListRetrieveViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin,
     pass
 
 
-class IngredientViewSet(ListRetrieveViewSet):
+class IngredientViewSet(InstrumentedViewMixin, ConditionalGetMixin,
+                        CachedResponseMixin, ListRetrieveViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+    cache_namespace = 'ingredients'
+    version_names = ('ingredients',)
+    query_budget = 4
+
+    def filter_queryset(self, queryset):
+        """
+        Поиск по названию берётся из справочника в памяти, если он
+        загружен; запрос из фильтра к базе тогда не выполняется.
+        """
+        queryset = super().filter_queryset(queryset)
+        name = self.request.query_params.get('name')
+        if self.action == 'list' and name:
+            ingredients = ingredient_index.search(name)
+            if ingredients is not None:
+                return ingredients
+        return queryset
 
 
-class TagViewSet(ListRetrieveViewSet):
+class TagViewSet(InstrumentedViewMixin, ConditionalGetMixin,
+                 CachedResponseMixin, ListRetrieveViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    cache_namespace = 'tags'
+    version_names = ('tags',)
+    query_budget = 3
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
-    pagination_class = PageNumberPagination
+class RecipeViewSet(InstrumentedViewMixin, ConditionalGetMixin,
+                    CachedResponseMixin, viewsets.ModelViewSet):
+    queryset = Recipe.objects.defer('search_document').select_related(
+        'nutrition'
+    )
+    pagination_class = RecipePagination
     filter_backends = [DjangoFilterBackend]
     filter_class = RecipeFilter
     permission_classes = [IsAuthenticatedAuthorOrReadOnly]
+    cache_namespace = 'recipes'
+    version_names = ('recipes', 'tags', 'ingredients', 'trending')
+    personal = True
+    query_budget = {
+        'list': 12,
+        'retrieve': 12,
+        'favorite': 6,
+        'shopping_cart': 6,
+        'match': 10,
+        'feed': 10,
+        'similar': 7,
+        'favorite_batch': 8,
+        'shopping_cart_batch': 8,
+        'download_shopping_cart': 3,
+    }
+
+    def get_queryset(self):
+        user = self.request.user
+        if self.shared_response:
+            user = AnonymousUser()
+        return annotate_recipes(self.queryset, user)
+
+    def paginate_queryset(self, queryset):
+        if self.action == 'list' and is_trending_top_request(self.request):
+            queryset = TrendingRecipes(queryset)
+        page = super().paginate_queryset(queryset)
+        search = self.request.query_params.get('search')
+        if self.action == 'list' and search and page is not None:
+            add_search_snippets(page, search)
+        return page
+
+    def is_conditional(self, request):
+        """
+        Число добавлений в избранное меняется без смены версий данных:
+        сортировку по нему не кэшируем и не отвечаем на неё 304.
+        """
+        return request.query_params.get('ordering') != 'popular'
+
+    def is_cacheable(self, request):
+        params = request.query_params
+        return not (
+            'is_favorited' in params
+            or 'is_in_shopping_cart' in params
+            or params.get('author') == 'me'
+        )
+
+    def personalize(self, data, user):
+        flags = get_user_flags(user)
+        recipes = data['results'] if 'results' in data else [data]
+        for recipe in recipes:
+            recipe['is_favorited'] = recipe['id'] in flags['favorites']
+            recipe['is_in_shopping_cart'] = (
+                recipe['id'] in flags['shopping_cart']
+            )
+            recipe['author']['is_subscribed'] = (
+                recipe['author']['id'] in flags['following']
+            )
+        return data
+
+    def get_version_names(self, request):
+        names = super().get_version_names(request)
+        if self.action == 'retrieve':
+            names.remove('recipes')
+            names.remove('trending')
+        return names
+
+    def get_validators(self, request):
+        parts, personal_parts, modified = super().get_validators(request)
+        if self.action == 'retrieve' and self.kwargs['pk'].isdigit():
+            updated_at = Recipe.objects.filter(
+                pk=self.kwargs['pk']
+            ).values_list('updated_at', flat=True).first()
+            if updated_at is not None:
+                parts.append(updated_at.isoformat())
+                modified.append(updated_at)
+        return parts, personal_parts, modified
 
     def get_serializer_class(self):
         if self.request.method in ['GET']:
@@ -67,52 +186,164 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return create_or_delete_recipes_list(request, pk, Favorite)
 
     @action(
+        methods=['POST', 'DELETE'],
         detail=False,
-        methods=['GET'],
+        url_path='favorite/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def favorite_batch(self, request):
+        return batch_response(request, Favorite)
+
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='shopping_cart/batch',
         permission_classes=(IsAuthenticated,)
     )
+    def shopping_cart_batch(self, request):
+        return batch_response(request, ShoppingCart)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        pagination_class=PageNumberKeysetPagination
+    )
+    def match(self, request):
+        """Рецепты из имеющихся ингредиентов, по числу недостающих."""
+        results = recipe_match_index.match(
+            get_ingredient_ids(request), get_max_missing(request)
+        )
+        page = self.paginate_queryset(results)
+        recipes = annotate_recipes(
+            self.queryset, request.user
+        ).in_bulk([recipe_id for recipe_id, _, _ in page])
+        matched_recipes = []
+        for recipe_id, matched, missing in page:
+            recipe = recipes.get(recipe_id)
+            if recipe is None:
+                continue
+            recipe.matched_ingredients = matched
+            recipe.missing_ingredients = missing
+            matched_recipes.append(recipe)
+        serializer = self.get_serializer(matched_recipes, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['GET'])
+    def similar(self, request, pk):
+        """Рецепты с самыми похожими ингредиентами и тэгами."""
+        if not pk.isdigit():
+            raise Http404
+        ids = list(SimilarRecipe.objects.filter(
+            recipe_id=pk
+        ).order_by('-score', 'similar_id').values_list(
+            'similar_id', flat=True
+        )[:settings.SIMILAR_RECIPES_COUNT])
+        if not ids:
+            get_object_or_404(Recipe, id=pk)
+        recipes = annotate_recipes(self.queryset, request.user).in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for recipe_id in ids if recipe_id in recipes],
+            many=True
+        )
+        return Response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок пользователя, новые сверху."""
+        page = self.paginate_queryset(partial(get_feed, request.user))
+        recipes = annotate_recipes(
+            self.queryset, request.user
+        ).in_bulk([recipe_id for _, recipe_id, _ in page])
+        serializer = self.get_serializer(
+            [recipes[recipe_id] for _, recipe_id, _ in page
+             if recipe_id in recipes],
+            many=True
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=SHOPPING_CART_RENDERERS
+    )
     def download_shopping_cart(self, request):
-        shopping_dict = {}
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__in=request.user.shopping_cart.values('recipe')
-        ).select_related('ingredient')
-        for obj in ingredients:
-            ingredient = obj.ingredient.name
-            if ingredient not in shopping_dict:
-                shopping_dict[ingredient] = {
-                    'measurement_unit': obj.ingredient.measurement_unit,
-                    'amount': obj.amount
-                }
-            else:
-                shopping_dict[ingredient]['amount'] += obj.amount
-        shopping_cart = '{username} вот твой список покупок \n'
-        download_cart = shopping_cart.format(username=request.user.username)
-        for ingredient in shopping_dict:
-            download_cart += (
-                f'{ingredient} '
-                f'({shopping_dict[ingredient]["measurement_unit"]}) '
-                f'- {shopping_dict[ingredient]["amount"]}\n'
-            )
-        download_cart += 'foodgram'
-        response = HttpResponse(
-            download_cart,
-            content_type='text/plain;charset=UTF-8',
+        renderer = request.accepted_renderer
+        content_type = renderer.media_type
+        if renderer.render_style != 'binary':
+            content_type += ';charset=UTF-8'
+        response = StreamingHttpResponse(
+            shopping_cart_stream(renderer.format, request.user),
+            content_type=content_type,
         )
         response['Content-Disposition'] = (
             'attachment;'
-            'filename="shopping_cart.txt"'
+            f'filename="shopping_cart.{renderer.format}"'
         )
         return response
 
 
+def annotate_recipes(queryset, user):
+    authors = User.objects.all()
+    if user.is_anonymous:
+        false = Value(False, output_field=BooleanField())
+        queryset = queryset.annotate(favorited=false, in_shopping_cart=false)
+        authors = authors.annotate(is_subscribed=false)
+    else:
+        queryset = queryset.annotate(
+            favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            ))
+        )
+        authors = authors.annotate(is_subscribed=Exists(Follow.objects.filter(
+            user=user, following=OuterRef('pk')
+        )))
+    return queryset.prefetch_related(
+        Prefetch('author', queryset=authors),
+        'tags',
+        'recipe_ingredient__ingredient'
+    )
+
+
+def get_ingredient_ids(request):
+    values = [
+        value.strip()
+        for param in request.query_params.getlist('ingredients')
+        for value in param.split(',') if value.strip()
+    ]
+    if not values or not all(value.isdigit() for value in values):
+        raise ValidationError(
+            {'ingredients': 'Укажите id ингредиентов через запятую!'}
+        )
+    if len(values) > settings.RECIPE_MATCH_MAX_INGREDIENTS:
+        raise ValidationError({'ingredients': (
+            'Не больше '
+            f'{settings.RECIPE_MATCH_MAX_INGREDIENTS} ингредиентов!'
+        )})
+    return [int(value) for value in values]
+
+
+def get_max_missing(request):
+    max_missing = request.query_params.get('max_missing', '0')
+    if not max_missing.isdigit():
+        raise ValidationError(
+            {'max_missing': 'Укажите целое неотрицательное число!'}
+        )
+    return int(max_missing)
+
+
 def create_or_delete_recipes_list(request, pk, model):
     recipe = get_object_or_404(Recipe, id=pk)
     if request.method == 'POST':
-        obj, created = model.objects.get_or_create(
-            user=request.user,
-            recipe=recipe
-        )
-        if created:
+        if toggle_relation(model, request.user, recipe.id, add=True):
             serializer = CartSerializer(recipe)
             return Response(
                 serializer.data,
@@ -122,12 +353,7 @@ def create_or_delete_recipes_list(request, pk, model):
             {'errors': 'Рецепт уже в списке'},
             status=status.HTTP_400_BAD_REQUEST
         )
-    obj = model.objects.filter(
-        user=request.user,
-        recipe=recipe
-    )
-    if obj:
-        obj.delete()
+    if toggle_relation(model, request.user, recipe.id, add=False):
         return Response(
             status=status.HTTP_204_NO_CONTENT
         )
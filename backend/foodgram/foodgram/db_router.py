@@ -0,0 +1,88 @@
+import hashlib
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.signals import request_started
+from django.db import connections
+from django.dispatch import receiver
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+use_replica = ContextVar('use_replica', default=False)
+
+
+def get_pin_key(request):
+    credentials = (
+        request.META.get('HTTP_AUTHORIZATION')
+        or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    )
+    if not credentials:
+        return None
+    digest = hashlib.md5(credentials.encode()).hexdigest()
+    return f'db:primary-pin:{digest}'
+
+
+class ReplicaRouter:
+    """
+    Чтение в безопасных запросах - с реплик, запись и всё остальное -
+    в default. Без реплик в настройках всё идёт в default.
+    """
+
+    def db_for_read(self, model, **hints):
+        if settings.REPLICA_DATABASES and use_replica.get():
+            return random.choice(settings.REPLICA_DATABASES)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    """
+    Направляет чтение GET-запросов на реплики. После записи клиент
+    на REPLICA_PIN_SECONDS закрепляется за основной базой, чтобы видеть
+    свои изменения. Для нескольких воркеров нужен общий кэш.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        pin_key = get_pin_key(request)
+        safe = request.method in SAFE_METHODS
+        token = use_replica.set(
+            safe and (pin_key is None or not cache.get(pin_key))
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            use_replica.reset(token)
+        if not safe and pin_key is not None and response.status_code < 400:
+            cache.set(pin_key, True, settings.REPLICA_PIN_SECONDS)
+        return response
+
+
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    """
+    Постоянное соединение могло оборваться (рестарт базы, pgbouncer):
+    такое закрывается до запроса, и Django откроет новое.
+    """
+    for connection in connections.all():
+        if (
+            connection.connection is not None
+            and connection.settings_dict.get('CONN_HEALTH_CHECKS')
+            and not connection.in_atomic_block
+            and not connection.is_usable()
+        ):
+            connection.close()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
 
 from dotenv import load_dotenv
 
@@ -41,16 +42,19 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
-    'users',
-    'recipes',
-    'api',
+    'users.apps.UsersConfig',
+    'recipes.apps.RecepiesConfig',
+    'api.apps.ApiConfig',
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'foodgram.db_router.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +96,44 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', default='postgres'),
         'HOST': os.getenv('DB_HOST', default='db'),
         'PORT': os.getenv('DB_PORT', default=5432),
+        # Постоянные соединения: каждый поток воркера держит своё
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', default=60)),
+        # Проверять соединение перед запросом и переподключаться
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', default='True'
+        ) == 'True',
+        # За pgbouncer в режиме transaction серверные курсоры не работают
+        'DISABLE_SERVER_SIDE_CURSORS': os.getenv(
+            'DB_PGBOUNCER', default=''
+        ) == 'True',
+    }
+}
+
+# Реплики для чтения: хосты через запятую, остальные параметры как у default
+REPLICA_DATABASES = []
+for number, host in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', default='').split(','))
+):
+    alias = f'replica{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из основной базы
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', default=5))
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
     }
 }
 
@@ -147,3 +189,53 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 AUTH_USER_MODEL = 'users.User'
+
+IMAGE_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_MAX_PIXELS = 4096 * 4096
+IMAGE_THUMBNAIL_WIDTHS = (320, 640, 1280)
+IMAGE_THUMBNAIL_WORKERS = 2
+IMAGE_THUMBNAILS_ASYNC = True
+
+# В manage.py test превышение бюджета SQL-запросов - ошибка
+QUERY_BUDGET_STRICT = os.getenv(
+    'QUERY_BUDGET_STRICT', default=str('test' in sys.argv)
+) == 'True'
+
+API_CACHE_TIMEOUT = 300
+API_USER_FLAGS_TIMEOUT = 30
+
+BATCH_MAX_SIZE = 100
+
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_CACHE_SIZE = 1024
+INGREDIENT_SEARCH_CACHE_TTL = 300
+INGREDIENT_SEARCH_CACHE_MAX_ROWS = 50000
+
+RECIPE_SEARCH_CONFIG = 'russian'
+
+TAG_SLUGS_CACHE_TTL = 300
+
+RECIPE_MATCH_INDEX_TTL = 3600
+# Индекс строится в фоновом потоке, пока его нет - подбор запросом к базе
+RECIPE_MATCH_INDEX_ASYNC = True
+RECIPE_MATCH_MAX_INGREDIENTS = 50
+
+FEED_TIMELINE_SIZE = 500
+FEED_TIMELINE_TTL = 3600
+# Рецепты авторов с большим числом подписчиков читаются из базы
+FEED_FANOUT_MAX_FOLLOWERS = 1000
+
+# Вклад события в популярность убывает вдвое за TRENDING_HALF_LIFE_HOURS
+TRENDING_HALF_LIFE_HOURS = 48
+TRENDING_FAVORITE_WEIGHT = 1.0
+TRENDING_SHOPPING_CART_WEIGHT = 1.5
+TRENDING_MIN_SCORE = 0.01
+TRENDING_TOP_SIZE = 120
+
+SIMILAR_RECIPES_COUNT = 10
+SIMILAR_MAX_CANDIDATES = 1000
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    'SHOPPING_CART_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
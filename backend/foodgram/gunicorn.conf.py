@@ -0,0 +1,19 @@
+import multiprocessing
+import os
+
+bind = os.getenv('GUNICORN_BIND', default='0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', default=multiprocessing.cpu_count() * 2 + 1
+))
+# Каждый поток держит своё соединение с базой: всего их workers * threads
+threads = int(os.getenv('GUNICORN_THREADS', default=1))
+worker_class = 'gthread' if threads > 1 else 'sync'
+timeout = int(os.getenv('GUNICORN_TIMEOUT', default=30))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', default=1000))
+max_requests_jitter = max_requests // 10
+
+
+def post_worker_init(worker):
+    """Индекс «что приготовить» строится в фоне сразу после старта."""
+    from api.recipe_matching import recipe_match_index
+    recipe_match_index.start()
@@ -2,24 +2,51 @@ from django.contrib import admin
 
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
+from .nutrition import update_recipe_nutrition
+from .search import update_search_documents
 
 
 class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('id', 'name', 'measurement_unit')
+    list_display = (
+        'id', 'name', 'measurement_unit', 'base_unit', 'base_unit_factor',
+        'calories', 'price'
+    )
     list_filter = ('name',)
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if change:
+            recipe_ids = obj.recipes.values_list('id', flat=True)
+            update_search_documents(recipe_ids)
+            update_recipe_nutrition(recipe_ids)
+
 
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('name', 'author', 'times_added')
     list_filter = ('author', 'name', 'tags')
 
     def times_added(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
+    times_added.admin_order_field = 'favorites_count'
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_search_documents([obj.id])
 
 
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ('recipe', 'ingredient')
 
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        update_search_documents([obj.recipe_id])
+        update_recipe_nutrition([obj.recipe_id])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        update_search_documents([obj.recipe_id])
+        update_recipe_nutrition([obj.recipe_id])
+
 
 class FavoriteAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
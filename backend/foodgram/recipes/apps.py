@@ -1,5 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class RecepiesConfig(AppConfig):
     name = 'recipes'
+
+    def ready(self):
+        from .search import create_recipe_search_index
+        from .signals import create_ingredient_name_index
+        post_migrate.connect(create_ingredient_name_index, sender=self)
+        post_migrate.connect(create_recipe_search_index, sender=self)
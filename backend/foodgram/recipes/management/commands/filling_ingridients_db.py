@@ -1,32 +1,342 @@
 import csv
+import json
 import os
-from pathlib import Path
+from collections import Counter
+from itertools import islice
+from json.decoder import WHITESPACE
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
 
-from foodgram.settings import BASE_DIR
-from recipes.models import Ingredient
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from recipes.nutrition import update_recipe_nutrition
+from recipes.search import build_search_document
+from recipes.signals import bulk_changed
+from users.models import User
+
+JSON_CHUNK_SIZE = 64 * 1024
+NUTRITION_FIELDS = ('calories', 'proteins', 'fats', 'carbohydrates', 'price')
+FIELDS = {
+    'ingredients': ('name', 'measurement_unit', *NUTRITION_FIELDS),
+    'tags': ('name', 'slug', 'color'),
+    'recipes': None,
+}
+MODELS = {
+    'ingredients': Ingredient,
+    'tags': Tag,
+    'recipes': Recipe,
+}
+# Демо-рецептов в репозитории нет: для них путь к файлу обязателен
+DEFAULT_FILES = {
+    'ingredients': 'ingredients.csv',
+    'tags': 'tags.json',
+}
+
+
+def read_rows(path, fields):
+    """Построчно читает CSV, JSON Lines или JSON-массив."""
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8') as file:
+        if extension == '.csv':
+            if fields is None:
+                raise CommandError('Рецепты загружаются только из JSON.')
+            for row in csv.reader(file):
+                if row and row != list(fields[:len(row)]):
+                    yield dict(zip(fields, (value.strip() for value in row)))
+        elif extension == '.jsonl':
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+        elif extension == '.json':
+            yield from JsonArrayReader(file)
+        else:
+            raise CommandError(f'Неподдерживаемый формат файла: {path}')
+
+
+class JsonArrayReader:
+    """
+    Элементы JSON-массива по одному: файл читается кусками, в памяти
+    только текущий кусок и незаконченный элемент.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.position = 0
+
+    def __iter__(self):
+        self.expect('[')
+        if self.next_char() == ']':
+            return
+        while True:
+            yield self.decode()
+            if self.expect(',]') == ']':
+                return
+
+    def read_more(self):
+        chunk = self.file.read(JSON_CHUNK_SIZE)
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return bool(chunk)
+
+    def next_char(self):
+        """Следующий непробельный символ, позиция остаётся на нём."""
+        while True:
+            self.position = WHITESPACE.match(
+                self.buffer, self.position
+            ).end()
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self.read_more():
+                raise ValueError('Файл не содержит JSON-массив целиком.')
+
+    def expect(self, chars):
+        char = self.next_char()
+        if char not in chars:
+            raise ValueError(
+                f'Ожидается {" или ".join(chars)}, получено {char!r}.'
+            )
+        self.position += 1
+        return char
+
+    def decode(self):
+        self.next_char()
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(
+                    self.buffer, self.position
+                )
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # Число в конце куска могло оборваться - дочитываем
+            if end == len(self.buffer) and self.read_more():
+                continue
+            self.position = end
+            return item
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    batch = list(islice(rows, size))
+    while batch:
+        yield batch
+        batch = list(islice(rows, size))
+
+
+def get_nutrition(row):
+    """Необязательные колонки с калорийностью и ценой, пустые - None."""
+    return {
+        field: row[field] if row[field] != '' else None
+        for field in NUTRITION_FIELDS if field in row
+    }
+
+
+def import_ingredients(batch, counts):
+    rows = {
+        (row['name'], row['measurement_unit']): get_nutrition(row)
+        for row in batch
+        if row.get('name') and row.get('measurement_unit')
+    }
+    counts['skipped'] += len(batch) - len(rows)
+    existing = {
+        (ingredient.name, ingredient.measurement_unit): ingredient
+        for ingredient in Ingredient.objects.filter(
+            name__in={name for name, _ in rows}
+        )
+    }
+    changed = []
+    new = []
+    for (name, unit), nutrition in rows.items():
+        ingredient = existing.get((name, unit))
+        if ingredient is None:
+            ingredient = Ingredient(name=name, measurement_unit=unit)
+            new.append(ingredient)
+        old = [getattr(ingredient, field) for field in NUTRITION_FIELDS]
+        for field, value in nutrition.items():
+            setattr(ingredient, field, value)
+        ingredient.clean_fields(exclude=['name', 'measurement_unit'])
+        if ingredient.pk is None:
+            continue
+        if old != [getattr(ingredient, field) for field in NUTRITION_FIELDS]:
+            changed.append(ingredient)
+        else:
+            counts['skipped'] += 1
+    Ingredient.objects.bulk_update(changed, NUTRITION_FIELDS)
+    if changed:
+        update_recipe_nutrition(RecipeIngredient.objects.filter(
+            ingredient__in=changed
+        ).values('recipe_id'))
+    Ingredient.objects.bulk_create(new, ignore_conflicts=True)
+    counts['updated'] += len(changed)
+    counts['inserted'] += len(new)
+
+
+def import_tags(batch, counts):
+    rows = {row['slug']: row for row in batch if row.get('slug')}
+    counts['skipped'] += len(batch) - len(rows)
+    existing = Tag.objects.in_bulk(list(rows), field_name='slug')
+    changed = []
+    for slug, tag in existing.items():
+        row = rows[slug]
+        if (tag.name, tag.color) == (row['name'], row['color']):
+            counts['skipped'] += 1
+            continue
+        tag.name, tag.color = row['name'], row['color']
+        changed.append(tag)
+    Tag.objects.bulk_update(changed, ['name', 'color'])
+    Tag.objects.bulk_create(
+        (
+            Tag(name=row['name'], slug=slug, color=row['color'])
+            for slug, row in rows.items() if slug not in existing
+        )
+    )
+    counts['updated'] += len(changed)
+    counts['inserted'] += len(rows) - len(existing)
+
+
+def import_recipes(batch, counts):
+    authors = User.objects.in_bulk(
+        {row.get('author') for row in batch}, field_name='username'
+    )
+    tags = Tag.objects.in_bulk(
+        {slug for row in batch for slug in row.get('tags', ())},
+        field_name='slug'
+    )
+    ingredients = {
+        (ingredient.name, ingredient.measurement_unit): ingredient
+        for ingredient in Ingredient.objects.filter(name__in={
+            item['name'] for row in batch
+            for item in row.get('ingredients', ())
+        })
+    }
+    existing = set(Recipe.objects.filter(
+        author__in=authors.values(), name__in={row['name'] for row in batch}
+    ).values_list('author__username', 'name'))
+    created = []
+    for row in batch:
+        author = authors.get(row.get('author'))
+        if author is None or (author.username, row['name']) in existing:
+            counts['skipped'] += 1
+            continue
+        items = [
+            (ingredients[key], item['amount'])
+            for key, item in (
+                ((item['name'], item['measurement_unit']), item)
+                for item in row.get('ingredients', ())
+            )
+            if key in ingredients
+        ]
+        recipe = Recipe.objects.create(
+            author=author,
+            name=row['name'],
+            text=row['text'],
+            search_document=build_search_document(
+                row['text'], [ingredient.name for ingredient, _ in items]
+            ),
+            cooking_time=row['cooking_time'],
+            image=row['image']
+        )
+        recipe.tags.set(
+            [tags[slug] for slug in row.get('tags', ()) if slug in tags]
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in items
+        )
+        existing.add((author.username, row['name']))
+        created.append(recipe.id)
+        counts['inserted'] += 1
+    update_recipe_nutrition(created)
+
+
+def copy_ingredients(path, counts):
+    """Загрузка большого CSV через COPY во временную таблицу."""
+    table = Ingredient._meta.db_table
+    with connection.cursor() as cursor, open(path, encoding='utf-8') as file:
+        cursor.execute(
+            'CREATE TEMP TABLE ingredient_import '
+            '(name varchar(200), measurement_unit varchar(10)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY ingredient_import FROM STDIN WITH (FORMAT csv)', file
+        )
+        cursor.execute('SELECT COUNT(*) FROM ingredient_import')
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit) '
+            'SELECT DISTINCT name, measurement_unit FROM ingredient_import '
+            "WHERE name <> '' AND measurement_unit <> '' "
+            'ON CONFLICT (name, measurement_unit) DO NOTHING'
+        )
+        counts['inserted'] += cursor.rowcount
+        counts['skipped'] += total - cursor.rowcount
+
+
+IMPORTERS = {
+    'ingredients': import_ingredients,
+    'tags': import_tags,
+    'recipes': import_recipes,
+}
 
 
 class Command(BaseCommand):
+    help = (
+        'Загружает ингредиенты, тэги или демо-рецепты из CSV/JSON. '
+        'Повторный запуск не создаёт дубликатов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?')
+        parser.add_argument('--model', choices=FIELDS, default='ingredients')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Ингредиенты из CSV через COPY (только PostgreSQL)'
+        )
+
     def handle(self, *args, **options):
-        path = Path(BASE_DIR + '/data')
-        os.chdir(path)
-        self.import_ingredients()
-        self.stdout.write('Ингридиенты загружены!')
-
-    def import_ingredients(self, file='ingredients.csv'):
-        file_path = f'{file}'
-        with open(file_path, newline='', encoding='utf-8') as f:
-            reader = csv.reader(f)
-            ingrs_list = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1]
+        model = options['model']
+        path = options['path']
+        if path is None:
+            if model not in DEFAULT_FILES:
+                raise CommandError(
+                    f'Для --model {model} укажите путь к файлу.'
                 )
-                for row in reader
-            ]
-            Ingredient.objects.bulk_create(
-                ingrs_list,
-                batch_size = 500
+            path = os.path.join(
+                settings.BASE_DIR, 'data', DEFAULT_FILES[model]
             )
+        if not os.path.exists(path):
+            raise CommandError(f'Файл не найден: {path}')
+        counts = Counter(inserted=0, updated=0, skipped=0)
+        try:
+            with transaction.atomic():
+                if options['copy']:
+                    if (model != 'ingredients'
+                            or connection.vendor != 'postgresql'):
+                        raise CommandError(
+                            '--copy поддерживается только для ингредиентов '
+                            'в PostgreSQL.'
+                        )
+                    copy_ingredients(path, counts)
+                else:
+                    for batch in batches(
+                        read_rows(path, FIELDS[model]), options['batch_size']
+                    ):
+                        IMPORTERS[model](batch, counts)
+                if counts['inserted'] or counts['updated']:
+                    bulk_changed.send(sender=MODELS[model])
+        except (IntegrityError, KeyError, ValueError,
+                ValidationError) as error:
+            raise CommandError(f'Ошибка загрузки: {error!r}')
+        self.stdout.write(
+            'Загрузка завершена! Добавлено: {inserted}, обновлено: '
+            '{updated}, пропущено: {skipped}.'.format(**counts)
+        )
@@ -0,0 +1,214 @@
+import random
+import uuid
+from datetime import timedelta
+from io import BytesIO
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+
+from recipes.models import (DataVersion, Favorite, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, Tag)
+from users.models import Follow, User
+
+# Размер пачки задаёт сам Django по ограничениям базы, здесь - только
+# сколько связей копить в памяти перед записью
+BATCH_SIZE = 5000
+DEMO_IMAGE = 'recipes/images/load_demo.png'
+DEMO_TAGS = (
+    ('Завтрак', 'breakfast', '#E26C2D'),
+    ('Обед', 'lunch', '#49B64E'),
+    ('Ужин', 'dinner', '#8775D2'),
+)
+
+
+def zipf_weights(size, exponent):
+    return [1 / rank ** exponent for rank in range(1, size + 1)]
+
+
+def sample_unique(population, cum_weights, count):
+    count = min(count, len(population))
+    result = set()
+    while len(result) < count:
+        result.update(random.choices(
+            population, cum_weights=cum_weights, k=count - len(result)
+        ))
+    return result
+
+
+def cumulative(weights):
+    total = 0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        'Генерирует синтетические данные для нагрузочного тестирования: '
+        'пользователей, подписки, рецепты, избранное и корзины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--min-ingredients', type=int, default=5)
+        parser.add_argument('--max-ingredients', type=int, default=40)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Максимум подписок на пользователя')
+        parser.add_argument('--favorites', type=int, default=30,
+                            help='Максимум рецептов в избранном')
+        parser.add_argument('--cart', type=int, default=10,
+                            help='Максимум рецептов в корзине')
+        parser.add_argument('--zipf', type=float, default=1.1,
+                            help='Показатель распределения популярности')
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if len(ingredient_ids) < options['max_ingredients']:
+            raise CommandError(
+                'Сначала загрузите ингредиенты: '
+                'python manage.py filling_ingridients_db'
+            )
+        self.run = uuid.uuid4().hex[:8]
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            tags = self.get_tags()
+            weights = cumulative(zipf_weights(len(users), options['zipf']))
+            recipes = self.create_recipes(options['recipes'], users, weights)
+            self.create_recipe_relations(
+                recipes, tags, ingredient_ids, options
+            )
+            self.create_follows(users, weights, options['follows'])
+            weights = cumulative(zipf_weights(len(recipes), options['zipf']))
+            for model, limit in (
+                (Favorite, options['favorites']),
+                (ShoppingCart, options['cart'])
+            ):
+                self.create_user_recipes(model, users, recipes, weights, limit)
+            for name in ('recipes', 'tags'):
+                DataVersion.bump(name)
+        call_command('recalculate_counters', stdout=self.stdout)
+        call_command('update_search_documents', stdout=self.stdout)
+        call_command('update_recipe_nutrition', stdout=self.stdout)
+        call_command('update_trending', full=True, stdout=self.stdout)
+        call_command('update_similar_recipes', full=True, stdout=self.stdout)
+        cache.clear()
+        self.stdout.write(
+            f'Создано: {len(users)} пользователей, {len(recipes)} рецептов '
+            f'(метка {self.run}).'
+        )
+
+    def create_users(self, count):
+        password = make_password('password')
+        User.objects.bulk_create(
+            (
+                User(
+                    username=f'load_{self.run}_{number}',
+                    email=f'load_{self.run}_{number}@example.com',
+                    first_name='Нагрузочный',
+                    last_name=f'Пользователь {number}',
+                    password=password
+                )
+                for number in range(count)
+            )
+        )
+        return list(User.objects.filter(
+            username__startswith=f'load_{self.run}_'
+        ).order_by('id').values_list('id', flat=True))
+
+    def get_tags(self):
+        for name, slug, color in DEMO_TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('id', flat=True))
+
+    def create_recipes(self, count, users, weights):
+        if not default_storage.exists(DEMO_IMAGE):
+            buffer = BytesIO()
+            Image.new('RGB', (640, 480), '#E26C2D').save(buffer, 'PNG')
+            default_storage.save(DEMO_IMAGE, ContentFile(buffer.getvalue()))
+        authors = random.choices(users, cum_weights=weights, k=count)
+        Recipe.objects.bulk_create(
+            (
+                Recipe(
+                    author_id=author,
+                    name=f'Рецепт {self.run}-{number}',
+                    image=DEMO_IMAGE,
+                    text='Сгенерированный рецепт для нагрузочного теста.',
+                    cooking_time=random.randint(5, 180)
+                )
+                for number, author in enumerate(authors)
+            )
+        )
+        recipes = list(Recipe.objects.filter(
+            name__startswith=f'Рецепт {self.run}-'
+        ).only('id'))
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                seconds=random.randint(0, 365 * 24 * 3600)
+            )
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=1000)
+        return [recipe.id for recipe in recipes]
+
+    def create_recipe_relations(self, recipes, tags, ingredient_ids, options):
+        recipe_tags = []
+        recipe_ingredients = []
+        for recipe in recipes:
+            for tag in random.sample(tags, random.randint(1, len(tags))):
+                recipe_tags.append(
+                    Recipe.tags.through(recipe_id=recipe, tag_id=tag)
+                )
+            count = random.randint(
+                options['min_ingredients'], options['max_ingredients']
+            )
+            for ingredient in random.sample(ingredient_ids, count):
+                recipe_ingredients.append(RecipeIngredient(
+                    recipe_id=recipe,
+                    ingredient_id=ingredient,
+                    amount=random.randint(1, 500)
+                ))
+            if len(recipe_ingredients) >= BATCH_SIZE:
+                RecipeIngredient.objects.bulk_create(recipe_ingredients)
+                recipe_ingredients = []
+        RecipeIngredient.objects.bulk_create(recipe_ingredients)
+        Recipe.tags.through.objects.bulk_create(recipe_tags)
+
+    def create_follows(self, users, weights, limit):
+        follows = []
+        for user in users:
+            authors = sample_unique(users, weights, random.randint(0, limit))
+            follows.extend(
+                Follow(user_id=user, following_id=author)
+                for author in authors if author != user
+            )
+        Follow.objects.bulk_create(follows, ignore_conflicts=True)
+
+    def create_user_recipes(self, model, users, recipes, weights, limit):
+        objects = []
+        now = timezone.now()
+        for user in users:
+            chosen = sample_unique(recipes, weights, random.randint(0, limit))
+            objects.extend(
+                model(
+                    user_id=user,
+                    recipe_id=recipe,
+                    created_at=now - timedelta(
+                        seconds=random.randint(0, 30 * 24 * 3600)
+                    )
+                )
+                for recipe in chosen
+            )
+        model.objects.bulk_create(objects, ignore_conflicts=True)
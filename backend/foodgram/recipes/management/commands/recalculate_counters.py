@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe
+from users.models import Follow, User
+
+
+def count_subquery(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(
+                field
+            ).annotate(count=Count('pk')).values('count'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики избранного, рецептов и подписчиков'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        Recipe.objects.update(
+            favorites_count=count_subquery(Favorite.objects.all(), 'recipe')
+        )
+        User.objects.update(
+            recipes_count=count_subquery(Recipe.objects.all(), 'author'),
+            followers_count=count_subquery(Follow.objects.all(), 'following')
+        )
+        self.stdout.write('Счётчики пересчитаны!')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.nutrition import update_recipe_nutrition
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает калорийность и стоимость рецептов'
+
+    def handle(self, *args, **options):
+        update_recipe_nutrition()
+        self.stdout.write('Калорийность и стоимость рецептов обновлены!')
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recipes.search import update_search_documents
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый текст рецептов'
+
+    def handle(self, *args, **options):
+        update_search_documents()
+        self.stdout.write('Поисковый текст рецептов обновлён!')
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from recipes.similarity import update_similar_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты для изменённых с прошлого запуска. '
+        'Запускать периодически, например из cron раз в час'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать похожие для всех рецептов'
+        )
+
+    def handle(self, *args, **options):
+        count = update_similar_recipes(full=options['full'])
+        self.stdout.write(f'Похожие рецепты пересчитаны для {count}.')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.trending import update_trending_scores
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает популярность рецептов за последнее время. '
+        'Запускать периодически, например из cron раз в 10 минут'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Пересчитать по всем событиям, а не только по новым'
+        )
+
+    def handle(self, *args, **options):
+        top = update_trending_scores(full=options['full'])
+        self.stdout.write(
+            f'Популярность пересчитана, в топе {len(top)} рецептов.'
+        )
@@ -1,5 +1,7 @@
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, RegexValidator
-from django.db import models
+from django.db import connections, models, router
+from django.utils import timezone
 
 from users.models import User
 
@@ -13,10 +15,59 @@ class Ingredient(models.Model):
         max_length=10,
         verbose_name='Единицы измерения'
     )
+    base_unit = models.CharField(
+        max_length=10,
+        blank=True,
+        verbose_name='Единица для списка покупок'
+    )
+    base_unit_factor = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Сколько таких единиц в единице измерения'
+    )
+    calories = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Калории на единицу'
+    )
+    proteins = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Белки на единицу, г'
+    )
+    fats = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Жиры на единицу, г'
+    )
+    carbohydrates = models.FloatField(
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Углеводы на единицу, г'
+    )
+    price = models.DecimalField(
+        max_digits=10,
+        decimal_places=4,
+        null=True,
+        blank=True,
+        validators=[MinValueValidator(0)],
+        verbose_name='Цена за единицу'
+    )
 
     def __str__(self):
         return f'{self.name} - {self.measurement_unit}'
 
+    def clean(self):
+        if bool(self.base_unit) != (self.base_unit_factor is not None):
+            raise ValidationError(
+                'Единица для списка покупок и множитель задаются вместе!'
+            )
+
     class Meta:
         ordering = ['name']
         constraints = [
@@ -76,6 +127,11 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Изображение'
     )
+    thumbnails_ready = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Превью готовы'
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -90,6 +146,12 @@ class Recipe(models.Model):
     text = models.TextField(
         verbose_name='Описание'
     )
+    search_document = models.TextField(
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Текст для поиска'
+    )
     cooking_time = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(1)],
         verbose_name='Время готовки'
@@ -110,12 +172,50 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Добавлений в избранное'
+    )
+    trending_score = models.FloatField(
+        default=0,
+        editable=False,
+        verbose_name='Популярность за последнее время'
+    )
+    trending_stale = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Пересчитать популярность целиком'
+    )
 
     def __str__(self):
         return f'{self.name}'
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_favorites_id_idx'
+            ),
+            models.Index(
+                fields=['-trending_score', '-id'],
+                name='recipe_trending_id_idx'
+            ),
+            models.Index(
+                fields=['trending_stale'],
+                name='recipe_trending_stale_idx',
+                condition=models.Q(trending_stale=True)
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -148,6 +248,99 @@ class RecipeIngredient(models.Model):
         ]
 
 
+class RecipeNutrition(models.Model):
+    """Пищевая ценность и стоимость рецепта, сумма по ингредиентам"""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='nutrition',
+        verbose_name='Рецепт'
+    )
+    calories = models.FloatField(
+        default=0,
+        verbose_name='Калории'
+    )
+    proteins = models.FloatField(
+        default=0,
+        verbose_name='Белки, г'
+    )
+    fats = models.FloatField(
+        default=0,
+        verbose_name='Жиры, г'
+    )
+    carbohydrates = models.FloatField(
+        default=0,
+        verbose_name='Углеводы, г'
+    )
+    cost = models.DecimalField(
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        verbose_name='Стоимость'
+    )
+    is_complete = models.BooleanField(
+        default=False,
+        verbose_name='Данные есть для всех ингредиентов'
+    )
+
+    def __str__(self):
+        return f'{self.recipe_id}: {self.calories} ккал, {self.cost}'
+
+
+class SimilarRecipe(models.Model):
+    """Заранее посчитанные похожие рецепты"""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_recipes',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(
+        verbose_name='Сходство'
+    )
+
+    def __str__(self):
+        return f'{self.similar} похож на {self.recipe}'
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            ),
+        ]
+
+
+class TrendingRecipe(models.Model):
+    """Готовый топ популярного за последнее время"""
+    position = models.PositiveIntegerField(
+        primary_key=True,
+        verbose_name='Место'
+    )
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Рецепт'
+    )
+
+    def __str__(self):
+        return f'{self.position}. {self.recipe}'
+
+
 class Favorite(models.Model):
     """Модель избранного"""
     user = models.ForeignKey(
@@ -162,6 +355,11 @@ class Favorite(models.Model):
         related_name='favorites',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     def __str__(self):
         return f'{self.user} добавил {self.recipe} в избранное.'
@@ -188,6 +386,11 @@ class ShoppingCart(models.Model):
         related_name='shopping_cart',
         verbose_name='Рецепт'
     )
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Дата добавления'
+    )
 
     def __str__(self):
         return f'{self.recipe} в корзине {self.user}'
@@ -200,3 +403,48 @@ class ShoppingCart(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+
+
+class DataVersion(models.Model):
+    """Версии данных для условных GET-запросов"""
+    name = models.CharField(
+        max_length=50,
+        unique=True,
+        verbose_name='Название'
+    )
+    version = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Версия'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    def __str__(self):
+        return f'{self.name} - {self.version}'
+
+    @classmethod
+    def bump(cls, name, updated_at=None):
+        """
+        Один запрос INSERT ... ON CONFLICT DO UPDATE: первая версия
+        создаётся без лишних SELECT и точек сохранения.
+        """
+        connection = connections[router.db_for_write(cls)]
+        quote = connection.ops.quote_name
+        table = quote(cls._meta.db_table)
+        name_column, version_column, updated_column = (
+            quote(cls._meta.get_field(field).column)
+            for field in ('name', 'version', 'updated_at')
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} '
+                f'({name_column}, {version_column}, {updated_column}) '
+                f'VALUES (%s, 0, %s) ON CONFLICT ({name_column}) DO UPDATE '
+                f'SET {version_column} = {table}.{version_column} + 1, '
+                f'{updated_column} = EXCLUDED.{updated_column}',
+                [name, connection.ops.adapt_datetimefield_value(
+                    updated_at or timezone.now()
+                )]
+            )
@@ -0,0 +1,71 @@
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, F, FloatField, Q, Sum
+
+from .models import Recipe, RecipeIngredient, RecipeNutrition
+
+CHUNK_SIZE = 1000
+NUTRIENTS = ('calories', 'proteins', 'fats', 'carbohydrates')
+FIELDS = (*NUTRIENTS, 'cost', 'is_complete')
+
+
+def get_nutrition_totals(recipe_ids):
+    """Суммы по ингредиентам рецептов одним запросом: {id рецепта: {...}}."""
+    totals = {
+        nutrient: Sum(
+            F('amount') * F(f'ingredient__{nutrient}'),
+            output_field=FloatField()
+        )
+        for nutrient in NUTRIENTS
+    }
+    unknown = Q(ingredient__price__isnull=True)
+    for nutrient in NUTRIENTS:
+        unknown |= Q(**{f'ingredient__{nutrient}__isnull': True})
+    return {
+        row.pop('recipe_id'): row
+        for row in RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids
+        ).order_by().values('recipe_id').annotate(
+            cost=Sum(
+                F('amount') * F('ingredient__price'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)
+            ),
+            unknown=Count('id', filter=unknown),
+            **totals
+        )
+    }
+
+
+def update_recipe_nutrition(recipe_ids=None):
+    """
+    Пересчитывает сводку рецептов. Вызывается при смене ингредиентов
+    рецепта или данных ингредиента, без аргументов - для всех рецептов.
+    """
+    recipes = Recipe.objects.order_by('id')
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=recipe_ids)
+    last_id = 0
+    while True:
+        ids = list(recipes.filter(id__gt=last_id).values_list(
+            'id', flat=True
+        )[:CHUNK_SIZE])
+        if not ids:
+            return
+        totals = get_nutrition_totals(ids)
+        existing = RecipeNutrition.objects.in_bulk(ids)
+        new = []
+        for recipe_id in ids:
+            row = totals.get(recipe_id, {'unknown': 0})
+            nutrition = existing.get(recipe_id)
+            if nutrition is None:
+                nutrition = RecipeNutrition(recipe_id=recipe_id)
+                new.append(nutrition)
+            for nutrient in NUTRIENTS:
+                setattr(nutrition, nutrient, row.get(nutrient) or 0)
+            nutrition.cost = Decimal(row.get('cost') or 0).quantize(
+                Decimal('0.01')
+            )
+            nutrition.is_complete = recipe_id in totals and not row['unknown']
+        RecipeNutrition.objects.bulk_update(existing.values(), FIELDS)
+        RecipeNutrition.objects.bulk_create(new)
+        last_id = ids[-1]
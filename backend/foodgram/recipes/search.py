@@ -0,0 +1,93 @@
+from django.conf import settings
+from django.db import OperationalError, connections
+
+from .models import Recipe, RecipeIngredient
+
+FTS_TABLE = 'recipes_recipe_fts'
+CHUNK_SIZE = 1000
+
+
+def get_search_vector(table=None):
+    """Взвешенный tsvector: название важнее описания и ингредиентов."""
+    prefix = f'{table}.' if table else ''
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        f"(setweight(to_tsvector('{config}', "
+        f"coalesce({prefix}name, '')), 'A') || "
+        f"setweight(to_tsvector('{config}', "
+        f"coalesce({prefix}search_document, '')), 'B'))"
+    )
+
+
+def build_search_document(text, ingredient_names):
+    return '\n'.join([text, ' '.join(ingredient_names)])
+
+
+def update_search_documents(recipe_ids=None):
+    """Пересобирает поисковый текст рецептов из описания и ингредиентов."""
+    recipes = Recipe.objects.only('id', 'text').order_by('id')
+    if recipe_ids is not None:
+        recipes = recipes.filter(id__in=list(recipe_ids))
+    last_id = 0
+    while True:
+        chunk = list(recipes.filter(id__gt=last_id)[:CHUNK_SIZE])
+        if not chunk:
+            return
+        names = {}
+        for recipe_id, name in RecipeIngredient.objects.filter(
+            recipe__in=chunk
+        ).values_list('recipe_id', 'ingredient__name'):
+            names.setdefault(recipe_id, []).append(name)
+        for recipe in chunk:
+            recipe.search_document = build_search_document(
+                recipe.text, names.get(recipe.id, ())
+            )
+        Recipe.objects.bulk_update(chunk, ['search_document'])
+        last_id = chunk[-1].id
+
+
+def create_recipe_search_index(sender, using, **kwargs):
+    """
+    GIN-индекс по tsvector в PostgreSQL, FTS5-таблица с триггерами в SQLite.
+    """
+    connection = connections[using]
+    table = Recipe._meta.db_table
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS recipes_recipe_search '
+                f'ON {table} USING gin ({get_search_vector()})'
+            )
+        return
+    if connection.vendor != 'sqlite':
+        return
+    columns = 'name, search_document'
+    insert = (
+        f'INSERT INTO {FTS_TABLE}(rowid, {columns}) '
+        'VALUES (new.id, new.name, new.search_document);'
+    )
+    delete = (
+        f'INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {columns}) '
+        "VALUES ('delete', old.id, old.name, old.search_document);"
+    )
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} '
+                f"USING fts5({columns}, content='{table}', "
+                "content_rowid='id')"
+            )
+            for name, event, body in (
+                ('ai', 'INSERT', insert),
+                ('ad', 'DELETE', delete),
+                ('au', f'UPDATE OF {columns}', delete + insert),
+            ):
+                cursor.execute(
+                    f'CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{name} '
+                    f'AFTER {event} ON {table} BEGIN {body} END'
+                )
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            )
+    except OperationalError:
+        pass
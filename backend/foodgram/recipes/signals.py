@@ -0,0 +1,62 @@
+from django.db import connections
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from users.models import User
+from .models import Favorite, Recipe, ShoppingCart
+
+# bulk_create и bulk_update не отправляют сигналы моделей: загрузка
+# справочников сообщает об изменениях одним сигналом на модель
+bulk_changed = Signal()
+
+
+def create_ingredient_name_index(sender, using, **kwargs):
+    """Триграммный индекс для поиска ингредиентов по части названия."""
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+            'ON recipes_ingredient USING gin (name gin_trgm_ops)'
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def increase_recipes_count(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.author_id).update(
+            recipes_count=F('recipes_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Recipe)
+def decrease_recipes_count(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.author_id).update(
+        recipes_count=Greatest(F('recipes_count') - 1, 0)
+    )
+
+
+@receiver(post_save, sender=Favorite)
+def increase_favorites_count(sender, instance, created, **kwargs):
+    if created:
+        Recipe.objects.filter(pk=instance.recipe_id).update(
+            favorites_count=F('favorites_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+def decrease_favorites_count(sender, instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).update(
+        favorites_count=Greatest(F('favorites_count') - 1, 0),
+        trending_stale=True
+    )
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def mark_trending_stale(sender, instance, **kwargs):
+    """Популярность рецепта пересчитается по оставшимся событиям."""
+    Recipe.objects.filter(pk=instance.recipe_id).update(trending_stale=True)
@@ -0,0 +1,152 @@
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .models import DataVersion, Recipe, RecipeIngredient, SimilarRecipe
+
+BATCH_SIZE = 5000
+SYNC_MARGIN = timedelta(seconds=30)
+VERSION_NAME = 'similar'
+
+
+class SimilarityIndex:
+    """
+    Признаки рецептов (ингредиенты и тэги) и инвертированный индекс
+    ингредиент -> рецепты. Кандидаты в похожие набираются по общим
+    ингредиентам, начиная с самых редких, не больше
+    SIMILAR_MAX_CANDIDATES: частые ингредиенты вроде соли почти
+    ничего не говорят о сходстве.
+    """
+
+    def __init__(self):
+        self.features = defaultdict(set)
+        for recipe_id, ingredient_id in RecipeIngredient.objects.values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator():
+            self.features[recipe_id].add(ingredient_id)
+        self.postings = defaultdict(list)
+        for recipe_id, ingredients in self.features.items():
+            for ingredient_id in ingredients:
+                self.postings[ingredient_id].append(recipe_id)
+        # Тэги - отрицательные признаки, чтобы не совпасть с ингредиентами
+        for recipe_id, tag_id in Recipe.tags.through.objects.values_list(
+            'recipe_id', 'tag_id'
+        ).iterator():
+            self.features[recipe_id].add(-tag_id)
+
+    def candidates(self, recipe_id, own):
+        limit = settings.SIMILAR_MAX_CANDIDATES + 1
+        candidates = set()
+        for ingredient_id in sorted(
+            (feature for feature in own if feature > 0),
+            key=lambda feature: len(self.postings[feature])
+        ):
+            candidates.update(
+                self.postings[ingredient_id][:limit - len(candidates)]
+            )
+            if len(candidates) >= limit:
+                break
+        candidates.discard(recipe_id)
+        return candidates
+
+    def scores(self, recipe_id):
+        """Сходство Жаккара с каждым кандидатом: {id: сходство}."""
+        own = self.features.get(recipe_id)
+        if not own:
+            return {}
+        scores = {}
+        for other_id in self.candidates(recipe_id, own):
+            other = self.features[other_id]
+            common = len(own & other)
+            scores[other_id] = common / (len(own) + len(other) - common)
+        return scores
+
+    def top(self, recipe_id):
+        return heapq.nlargest(
+            settings.SIMILAR_RECIPES_COUNT,
+            self.scores(recipe_id).items(),
+            key=lambda item: (item[1], -item[0])
+        )
+
+
+def chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def save_neighbours(index, recipe_ids):
+    """Записывает списки похожих для recipe_ids, старые уже удалены."""
+    size = BATCH_SIZE // settings.SIMILAR_RECIPES_COUNT
+    for chunk in chunks(recipe_ids, size):
+        SimilarRecipe.objects.bulk_create(
+            SimilarRecipe(
+                recipe_id=recipe_id, similar_id=other_id, score=score
+            )
+            for recipe_id in chunk
+            for other_id, score in index.top(recipe_id)
+        )
+
+
+def get_affected(index, changed):
+    """
+    Кроме изменённых рецептов пересчитываются те, в чьих списках они
+    есть, и те, куда они теперь могут попасть.
+    """
+    affected = set(changed)
+    affected.update(SimilarRecipe.objects.filter(
+        similar__in=changed
+    ).values_list('recipe_id', flat=True))
+    scores = {}
+    for recipe_id in changed:
+        for other_id, score in index.scores(recipe_id).items():
+            scores[other_id] = max(score, scores.get(other_id, 0))
+    lists = {}
+    for chunk in chunks(scores.keys() - affected):
+        lists.update({
+            recipe_id: (count, lowest)
+            for recipe_id, count, lowest in SimilarRecipe.objects.filter(
+                recipe__in=chunk
+            ).values('recipe_id').annotate(
+                count=Count('id'), lowest=Min('score')
+            ).values_list('recipe_id', 'count', 'lowest')
+        })
+    for recipe_id, score in scores.items():
+        count, lowest = lists.get(recipe_id, (0, 0))
+        if count < settings.SIMILAR_RECIPES_COUNT or score >= lowest:
+            affected.add(recipe_id)
+    return affected
+
+
+@transaction.atomic
+def update_similar_recipes(full=False):
+    """
+    Пересчитывает похожие рецепты: все или только затронутые
+    изменениями с прошлого запуска. Вернёт число пересчитанных рецептов.
+    """
+    now = timezone.now()
+    since = None
+    if not full:
+        since = DataVersion.objects.select_for_update().filter(
+            name=VERSION_NAME
+        ).values_list('updated_at', flat=True).first()
+    index = SimilarityIndex()
+    recipe_ids = set(Recipe.objects.values_list('id', flat=True))
+    if since is None:
+        SimilarRecipe.objects.all().delete()
+        affected = recipe_ids
+    else:
+        changed = set(Recipe.objects.filter(
+            updated_at__gte=since - SYNC_MARGIN
+        ).values_list('id', flat=True))
+        affected = get_affected(index, changed) & recipe_ids
+        for chunk in chunks(affected):
+            SimilarRecipe.objects.filter(recipe__in=chunk).delete()
+    save_neighbours(index, affected)
+    DataVersion.bump(VERSION_NAME, updated_at=now)
+    return len(affected)
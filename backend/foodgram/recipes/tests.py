@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+
+from users.models import User
+from .models import DataVersion, Ingredient, Recipe, Tag
+
+COMMAND = 'filling_ingridients_db'
+
+
+class ImportCommandTest(TestCase):
+    """Загрузка справочников из CSV, JSON Lines и JSON-массива."""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, text):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(text)
+        return path
+
+    def load(self, path, model='ingredients'):
+        output = StringIO()
+        call_command(COMMAND, path, model=model, batch_size=2, stdout=output)
+        return output.getvalue()
+
+    def get_ingredients(self):
+        return set(Ingredient.objects.values_list(
+            'name', 'measurement_unit', 'calories'
+        ))
+
+    def test_ingredient_formats(self):
+        rows = [
+            {'name': 'мука', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+            {'name': 'молоко', 'measurement_unit': 'мл'},
+        ]
+        paths = [
+            self.write('ingredients.csv', ''.join(
+                f'{row["name"]},{row["measurement_unit"]}\n' for row in rows
+            )),
+            self.write('ingredients.jsonl', ''.join(
+                json.dumps(row, ensure_ascii=False) + '\n' for row in rows
+            )),
+            self.write('ingredients.json', json.dumps(rows, indent=4)),
+        ]
+        expected = {
+            (row['name'], row['measurement_unit'], None) for row in rows
+        }
+        for path in paths:
+            with self.subTest(path=os.path.basename(path)):
+                Ingredient.objects.all().delete()
+                self.assertIn('Добавлено: 3', self.load(path))
+                self.assertEqual(self.get_ingredients(), expected)
+
+    def test_reimport_is_idempotent(self):
+        path = self.write('ingredients.csv', 'мука,г\nсоль,г\nмука,г\n')
+        self.load(path)
+        version = DataVersion.objects.get(name='ingredients').version
+        self.assertIn(
+            'Добавлено: 0, обновлено: 0, пропущено: 3', self.load(path)
+        )
+        self.assertEqual(Ingredient.objects.count(), 2)
+        self.assertEqual(
+            DataVersion.objects.get(name='ingredients').version, version
+        )
+        path = self.write(
+            'ingredients.csv',
+            'name,measurement_unit,calories\nмука,г,3.5\nсоль,г,\n'
+        )
+        self.assertIn('обновлено: 1, пропущено: 1', self.load(path))
+        self.assertEqual(self.get_ingredients(), {
+            ('мука', 'г', 3.5), ('соль', 'г', None)
+        })
+        self.assertEqual(
+            DataVersion.objects.get(name='ingredients').version, version + 1
+        )
+
+    def test_tags_and_recipes(self):
+        tags = [
+            {'name': 'Завтрак', 'slug': 'breakfast', 'color': '#E26C2D'},
+            {'name': 'Обед', 'slug': 'lunch', 'color': '#49B64E'},
+        ]
+        path = self.write('tags.json', json.dumps(tags))
+        self.load(path, 'tags')
+        self.assertIn('пропущено: 2', self.load(path, 'tags'))
+        self.assertEqual(Tag.objects.count(), 2)
+        User.objects.create(username='author', email='a@ya.ru')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        recipe = {
+            'author': 'author', 'name': 'Блины', 'text': 'Описание',
+            'cooking_time': 20, 'image': 'recipes/images/pancakes.png',
+            'tags': ['breakfast'],
+            'ingredients': [
+                {'name': 'мука', 'measurement_unit': 'г', 'amount': 200}
+            ],
+        }
+        path = self.write('recipes.jsonl', json.dumps(recipe) + '\n')
+        self.load(path, 'recipes')
+        self.assertIn('пропущено: 1', self.load(path, 'recipes'))
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            list(recipe.tags.values_list('slug', flat=True)), ['breakfast']
+        )
+        self.assertEqual(recipe.recipe_ingredient.get().amount, 200)
+
+    def test_recipes_require_path(self):
+        with self.assertRaisesMessage(CommandError, 'укажите путь'):
+            call_command(COMMAND, model='recipes')
@@ -0,0 +1,126 @@
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Value, When
+from django.utils import timezone
+
+from .models import DataVersion, Favorite, Recipe, ShoppingCart, TrendingRecipe
+
+CHUNK_SIZE = 500
+VERSION_NAME = 'trending'
+
+
+def get_decay(seconds):
+    """Во сколько раз уменьшается вклад события за seconds секунд."""
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    return 0.5 ** (seconds / half_life)
+
+
+def collect_events(since, now, recipe_ids=None):
+    """Вклад добавлений в избранное и корзину за период на момент now."""
+    scores = defaultdict(float)
+    for model, weight in (
+        (Favorite, settings.TRENDING_FAVORITE_WEIGHT),
+        (ShoppingCart, settings.TRENDING_SHOPPING_CART_WEIGHT),
+    ):
+        events = model.objects.filter(created_at__lte=now)
+        if since is not None:
+            events = events.filter(created_at__gt=since)
+        if recipe_ids is not None:
+            events = events.filter(recipe_id__in=recipe_ids)
+        for recipe_id, created_at in events.values_list(
+            'recipe_id', 'created_at'
+        ).iterator():
+            age = max((now - created_at).total_seconds(), 0)
+            scores[recipe_id] += weight * get_decay(age)
+    return scores
+
+
+def recalculate_stale_scores(now):
+    """
+    Удалённое из избранного или корзины событие не вычесть из
+    накопленного счёта: счета таких рецептов считаются заново по
+    оставшимся событиям. Строки блокируются до конца транзакции, чтобы
+    не сбросить отметку, поставленную удалением во время пересчёта.
+    """
+    recipe_ids = list(Recipe.objects.select_for_update().filter(
+        trending_stale=True
+    ).values_list('id', flat=True))
+    for start in range(0, len(recipe_ids), CHUNK_SIZE):
+        chunk = recipe_ids[start:start + CHUNK_SIZE]
+        scores = collect_events(None, now, chunk)
+        Recipe.objects.filter(id__in=chunk).update(
+            trending_score=Case(
+                *(
+                    When(id=recipe_id, then=Value(score))
+                    for recipe_id, score in scores.items()
+                    if score >= settings.TRENDING_MIN_SCORE
+                ),
+                default=Value(0),
+                output_field=FloatField()
+            ),
+            trending_stale=False
+        )
+
+
+@transaction.atomic
+def update_trending_scores(full=False):
+    """
+    Счёт рецепта - сумма весов событий, убывающих вдвое за
+    TRENDING_HALF_LIFE_HOURS. С прошлого пересчёта старые счета
+    умножаются на общий множитель затухания и к ним прибавляются
+    только новые события, а рецепты с удалёнными событиями
+    пересчитываются целиком. Топ сохраняется в базе для всех процессов,
+    вернёт id самых популярных рецептов.
+    """
+    now = timezone.now()
+    since = None
+    if not full:
+        since = DataVersion.objects.select_for_update().filter(
+            name=VERSION_NAME
+        ).values_list('updated_at', flat=True).first()
+    if since is None:
+        Recipe.objects.filter(trending_stale=True).update(
+            trending_stale=False
+        )
+    scored = Recipe.objects.filter(trending_score__gt=0)
+    decay = 0 if since is None else get_decay((now - since).total_seconds())
+    if not decay:
+        scored.update(trending_score=0)
+    else:
+        scored.update(trending_score=Case(
+            When(
+                trending_score__lt=settings.TRENDING_MIN_SCORE / decay,
+                then=Value(0)
+            ),
+            default=F('trending_score') * decay,
+            output_field=FloatField()
+        ))
+    scores = list(collect_events(since, now).items())
+    for start in range(0, len(scores), CHUNK_SIZE):
+        chunk = scores[start:start + CHUNK_SIZE]
+        Recipe.objects.filter(
+            id__in=[recipe_id for recipe_id, _ in chunk]
+        ).update(trending_score=F('trending_score') + Case(
+            *(
+                When(id=recipe_id, then=Value(score))
+                for recipe_id, score in chunk
+            ),
+            default=Value(0),
+            output_field=FloatField()
+        ))
+    if since is not None:
+        recalculate_stale_scores(now)
+    top = list(Recipe.objects.filter(
+        trending_score__gt=0
+    ).order_by('-trending_score', '-id').values_list(
+        'id', flat=True
+    )[:settings.TRENDING_TOP_SIZE])
+    TrendingRecipe.objects.all().delete()
+    TrendingRecipe.objects.bulk_create(
+        TrendingRecipe(position=position, recipe_id=recipe_id)
+        for position, recipe_id in enumerate(top)
+    )
+    DataVersion.bump(VERSION_NAME, updated_at=now)
+    return top
@@ -0,0 +1,67 @@
+from django.db.models import Case, CharField, F, FloatField, Value, When
+
+# Единица измерения -> (основная единица, сколько основных в одной)
+UNITS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л.': ('ч. л.', 1),
+    'ст. л.': ('ч. л.', 3),
+    'шт': ('шт.', 1),
+    'шт.': ('шт.', 1),
+}
+# Крупные единицы для вывода: (единица, множитель, только целым числом)
+DISPLAY_UNITS = {
+    'г': [('кг', 1000, False)],
+    'мл': [('л', 1000, False)],
+    'ч. л.': [('ст. л.', 3, True)],
+}
+
+
+def get_base_unit():
+    """
+    Основная единица в SQL: своя у ингредиента, если задана,
+    иначе по таблице UNITS, иначе его единица измерения.
+    """
+    return Case(
+        When(
+            ingredient__base_unit_factor__isnull=False,
+            then=F('ingredient__base_unit')
+        ),
+        *(
+            When(ingredient__measurement_unit=unit, then=Value(base))
+            for unit, (base, _) in UNITS.items()
+        ),
+        default=F('ingredient__measurement_unit'),
+        output_field=CharField()
+    )
+
+
+def get_base_factor():
+    """Сколько основных единиц в одной единице измерения ингредиента."""
+    return Case(
+        When(
+            ingredient__base_unit_factor__isnull=False,
+            then=F('ingredient__base_unit_factor')
+        ),
+        *(
+            When(ingredient__measurement_unit=unit, then=Value(factor))
+            for unit, (_, factor) in UNITS.items() if factor != 1
+        ),
+        default=Value(1),
+        output_field=FloatField()
+    )
+
+
+def format_amount(amount):
+    amount = round(amount, 3)
+    return int(amount) if amount == int(amount) else amount
+
+
+def humanize(amount, unit):
+    """1500 г -> 1.5 кг, 6 ч. л. -> 2 ст. л.; остальное как есть."""
+    for display_unit, factor, whole in DISPLAY_UNITS.get(unit, ()):
+        if amount >= factor and (not whole or amount % factor == 0):
+            return format_amount(amount / factor), display_unit
+    return format_amount(amount), unit
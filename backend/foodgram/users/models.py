@@ -29,6 +29,16 @@ class User(AbstractUser):
         max_length=150,
         verbose_name='Фамилия'
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов'
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков'
+    )
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}'
@@ -1,6 +1,5 @@
 from rest_framework import serializers
 
-from recipes.models import Recipe
 from .models import Follow, User
 
 
@@ -43,6 +42,8 @@ class AuthorSerializer(UserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         if (
             self.context.get('request') is not None
             and self.context.get('request').user.is_authenticated
@@ -55,7 +56,7 @@ class AuthorSerializer(UserSerializer):
 
 
 class FollowSerializer(serializers.ModelSerializer):
-    email = serializers.ReadOnlyField(source='following.id')
+    email = serializers.ReadOnlyField(source='following.email')
     id = serializers.ReadOnlyField(source='following.id')
     username = serializers.ReadOnlyField(source='following.username')
     first_name = serializers.ReadOnlyField(source='following.first_name')
@@ -65,27 +66,20 @@ class FollowSerializer(serializers.ModelSerializer):
     recipes_count = serializers.SerializerMethodField()
 
     def get_is_subscribed(self, obj):
-        return Follow.objects.filter(
-            user=obj.user,
-            following=obj.following
-        ).exists()
+        return True
 
     def get_recipes(self, obj):
         from api.serializers import CartSerializer
-        if self.context:
-            recipes_limit = self.context['request'].GET.get('recipes_limit')
-            if recipes_limit:
-                queryset = Recipe.objects.filter(
-                    author=obj.following
-                )[:int(recipes_limit)]
-        else:
-            queryset = Recipe.objects.filter(
-                author=obj.following
-            )
-        return CartSerializer(queryset, many=True).data
+        queryset = getattr(obj.following, 'limited_recipes', None)
+        if queryset is None:
+            queryset = obj.following.recipes.all()
+            recipes_limit = get_recipes_limit(self.context.get('request'))
+            if recipes_limit is not None:
+                queryset = queryset[:recipes_limit]
+        return CartSerializer(queryset, many=True, context=self.context).data
 
     def get_recipes_count(self, obj):
-        return Recipe.objects.filter(author=obj.following).count()
+        return obj.following.recipes_count
 
     class Meta:
         model = Follow
@@ -129,3 +123,12 @@ class TokenSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['email', 'password']
+
+
+def get_recipes_limit(request):
+    if request is None:
+        return None
+    recipes_limit = request.query_params.get('recipes_limit', '')
+    if recipes_limit.isdigit():
+        return int(recipes_limit)
+    return None
@@ -0,0 +1,21 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Follow, User
+
+
+@receiver(post_save, sender=Follow)
+def increase_followers_count(sender, instance, created, **kwargs):
+    if created:
+        User.objects.filter(pk=instance.following_id).update(
+            followers_count=F('followers_count') + 1
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def decrease_followers_count(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.following_id).update(
+        followers_count=Greatest(F('followers_count') - 1, 0)
+    )
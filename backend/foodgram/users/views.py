@@ -1,15 +1,22 @@
+from django.db.models import F, Prefetch, prefetch_related_objects
+from django.db.models.expressions import Window
+from django.db.models.functions import RowNumber
 from django.shortcuts import get_object_or_404
 from djoser import utils, views
 from djoser.conf import settings
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.pagination import PageNumberPagination
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 
+from api.metrics import InstrumentedViewMixin
+from api.pagination import SubscriptionPagination, UserPagination
+from api.relations import batch_response, toggle_relation
+from recipes.models import Recipe
 from .models import Follow, User
 from .serializers import (AuthorSerializer, FollowSerializer,
-                          PasswordSerializer, UserSerializer)
+                          PasswordSerializer, UserSerializer,
+                          get_recipes_limit)
 
 
 class CreateViewSet(
@@ -21,9 +28,17 @@ class CreateViewSet(
     pass
 
 
-class UserViewSet(CreateViewSet):
+class UserViewSet(InstrumentedViewMixin, CreateViewSet):
     queryset = User.objects.all()
-    pagination_class = PageNumberPagination
+    pagination_class = UserPagination
+    query_budget = {
+        'list': 4,
+        'retrieve': 4,
+        'me': 3,
+        'subscriptions': 5,
+        'subscribe': 10,
+        'subscribe_batch': 8,
+    }
     permission_classes = (AllowAny,)
 
     def get_serializer_class(self):
@@ -56,14 +71,17 @@ class UserViewSet(CreateViewSet):
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+        pagination_class=SubscriptionPagination
     )
     def subscriptions(self, request):
         queryset = Follow.objects.filter(
             user=request.user
         ).select_related('following')
+        page = self.paginate_queryset(queryset)
+        prefetch_subscription_recipes(page, get_recipes_limit(request))
         serializer = FollowSerializer(
-            self.paginate_queryset(queryset),
+            page,
             many=True,
             context={'request': request}
         )
@@ -82,30 +100,35 @@ class UserViewSet(CreateViewSet):
                     {'errors': 'Нет возможности подписаться на себя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            subscription, created = Follow.objects.get_or_create(
-                user=request.user, following=author
-            )
-            if not created:
+            if not toggle_relation(Follow, request.user, author.id, add=True):
                 return Response(
                     {'errors': 'Вы уже подписаны на этого пользователя'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            serializer = FollowSerializer(subscription)
+            serializer = FollowSerializer(
+                Follow(user=request.user, following=author),
+                context={'request': request}
+            )
             return Response(
                 serializer.data,
                 status=status.HTTP_201_CREATED
             )
-        subscription = Follow.objects.filter(
-            user=request.user, following=author
-        )
-        if subscription:
-            subscription.delete()
+        if toggle_relation(Follow, request.user, author.id, add=False):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {'errors': 'Вы не подписаны на этого пользователя'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
+    @action(
+        methods=['POST', 'DELETE'],
+        detail=False,
+        url_path='subscribe/batch',
+        permission_classes=(IsAuthenticated,)
+    )
+    def subscribe_batch(self, request):
+        return batch_response(request, Follow)
+
 
 class TokenCreateView(views.TokenCreateView):
     def _action(self, serializer):
@@ -115,3 +138,33 @@ class TokenCreateView(views.TokenCreateView):
             data=token_serializer_class(token).data,
             status=status.HTTP_201_CREATED
         )
+
+
+def prefetch_subscription_recipes(follows, recipes_limit):
+    """Последние рецепты всех авторов страницы подписок одним запросом."""
+    if not follows:
+        return
+    queryset = Recipe.objects.all()
+    if recipes_limit is not None:
+        ranked = Recipe.objects.filter(
+            author__in=[follow.following_id for follow in follows]
+        ).annotate(
+            row_number=Window(
+                expression=RowNumber(),
+                partition_by=[F('author')],
+                order_by=[F('pub_date').desc(), F('id').desc()]
+            )
+        ).order_by().values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        queryset = queryset.extra(
+            where=[
+                f'{Recipe._meta.db_table}.id IN (SELECT id FROM ({sql}) '
+                'AS ranked WHERE row_number <= %s)'
+            ],
+            params=[*params, recipes_limit]
+        )
+    prefetch_related_objects(follows, Prefetch(
+        'following__recipes',
+        queryset=queryset,
+        to_attr='limited_recipes'
+    ))